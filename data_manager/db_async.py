@@ -0,0 +1,223 @@
+"""
+Asyncio database utils, the counterparts of db_utils.read_sql, to_sql and run_sql
+for sqlalchemy async engines on the asyncpg driver
+(usage: create_async_engine('postgresql+asyncpg://...')).
+read_sql supports the rows read path only, mode='copy' raises
+"""
+import io
+import logging
+import time
+from typing import Any, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+except ImportError as error:
+    raise ImportError('db_async needs sqlalchemy>=1.4 and asyncpg, '
+                      'run: pip install data_manager[async]') from error
+
+from .db_cache import CATALOG_QUERY, QueryCache, get_catalog_cache
+from .db_copy import COPY_NULL, column_types_from_rows, encode_binary_copy, encode_csv_copy
+from .db_load import LoadMetrics
+from .db_types import NUMERIC_DTYPES, NUMERIC_OID, NUMERIC_SCALE, numeric_to_fixed
+from .db_utils import COLUMN_TYPES_QUERY, INSERT_STATEMENT, TIMEZONE_QUERY, WRITE_MODES
+
+LOGGER = logging.getLogger(__name__)
+READ_MODES = ('rows',)
+
+
+async def read_sql(sql_text: str, engine: AsyncEngine, mode: str = 'rows',
+                   numeric_dtype: str = None, numeric_scale: int = NUMERIC_SCALE,
+                   cache: QueryCache = None, cache_ttl: float = None, cache_token: Any = None,
+                   **parameters) -> pd.DataFrame:
+    """
+    read SQL query from a given async database engine
+    :param sql_text: sql text
+    :param engine: sqlalchemy async engine
+    :param mode: read path, only 'rows' is supported (default is rows)
+    :param numeric_dtype: decoding of NUMERIC columns, 'decimal', 'float64' or
+        'int64' scaled fixed point (default is decimal)
+    :param numeric_scale: number of decimals kept by the int64 policy
+        (ex. 12.5 -> 125000 for the default of 4)
+    :param cache: (optional) QueryCache or DiskQueryCache, repeated queries
+        are served from it
+    :param cache_ttl: seconds the cached result is valid for (default is the cache ttl)
+    :param cache_token: (optional) freshness token which is part of the cache key
+        (ex. the date the underlying data was last loaded)
+    :param parameters: (optional) parameters as key-value pairs
+        (usage: date = test_date)
+    :return: pandas Dataframe with the results
+    """
+    if mode not in READ_MODES:
+        raise ValueError('mode must be one of: {modes}'.format(modes=', '.join(READ_MODES)))
+    if numeric_dtype is not None and numeric_dtype not in NUMERIC_DTYPES:
+        raise ValueError('numeric_dtype must be one of: {dtypes}'.format(
+            dtypes=', '.join(NUMERIC_DTYPES)))
+    if cache is not None:
+        key = cache.make_key(sql_text, parameters, engine=engine.sync_engine, mode=mode,
+                             numeric_dtype=numeric_dtype, numeric_scale=numeric_scale,
+                             cache_token=cache_token)
+        out_ = cache.get(key)
+        if out_ is None:
+            out_ = await read_sql(sql_text, engine, mode=mode, numeric_dtype=numeric_dtype,
+                                  numeric_scale=numeric_scale, **parameters)
+            cache.put(key, out_, ttl=cache_ttl)
+        return out_
+
+    async with engine.connect() as conn:
+        result = await conn.execute(text(sql_text), parameters)
+        columns = [col for col in result.keys()]
+        type_codes = [col[1] for col in result.cursor.description]
+        rows = result.fetchall()
+    out_ = pd.DataFrame(rows, columns=columns)
+    if numeric_dtype in ('float64', 'int64'):
+        for idx, type_code in enumerate(type_codes):
+            if type_code == NUMERIC_OID:
+                out_[columns[idx]] = __decode_numeric([row[idx] for row in rows],
+                                                      numeric_dtype, numeric_scale)
+    return out_
+
+
+def __decode_numeric(values: list, numeric_dtype: str, numeric_scale: int = NUMERIC_SCALE
+                     ) -> Union[np.ndarray, pd.arrays.IntegerArray]:
+    """
+    decode the decimal.Decimal values of a NUMERIC column with a dtype policy. The values
+    are converted after the fetch, as a type codec set on the asyncpg connection does not
+    reach the statements already prepared by the sqlalchemy statement cache
+    :param values: decimal.Decimal or None values
+    :param numeric_dtype: 'float64' or 'int64' (scaled fixed point)
+    :param numeric_scale: number of decimals kept by the int64 policy
+    :return: float64 array with NaN nulls or Int64 array
+    """
+    if numeric_dtype == 'float64':
+        return np.array([np.nan if value is None else float(value) for value in values],
+                        dtype='float64')
+    return pd.array([None if value is None else numeric_to_fixed(str(value), numeric_scale)
+                     for value in values], dtype='Int64')
+
+
+def __insert_records(rows_chunk: pd.DataFrame) -> list:
+    """
+    rows of a chunk as tuples of python objects for executemany, nulls as None
+    :param rows_chunk: pandas dataframe
+    :return: list of tuples
+    """
+    records = rows_chunk.astype(object).where(rows_chunk.notna(), None)
+    return list(records.itertuples(index=False, name=None))
+
+
+async def to_sql(data: pd.DataFrame, engine: AsyncEngine, table_name: str,
+                 schema_name: str = None, chunksize: int = 100000,
+                 mode: str = 'copy') -> LoadMetrics:
+    """
+    commit pandas dataframe to a table by appending the data
+    :param data: pandas dataframe with data.
+        The columns of the table should be same name as table columns
+    :param engine: sqlalchemy async engine
+    :param table_name: tale name in the database
+    :param chunksize: chunks commiting data to the table
+    :param schema_name: schema name in which the table is location
+        (default is None)
+    :param mode: write path used for each chunk, 'copy' (csv COPY),
+        'binary' (binary COPY) or 'insert' (executemany) (default is copy)
+    :return: LoadMetrics of the load
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError('mode must be one of: {modes}'.format(modes=', '.join(WRITE_MODES)))
+
+    start = time.perf_counter()
+    table_ = await __get_db_object(object_name=table_name, schema_name=schema_name,
+                                   engine=engine)
+    metrics = LoadMetrics(table_name=table_)
+    db_schema, db_table = table_.split('.', 1)
+    columns = data.columns.tolist()
+    if mode == 'binary':
+        db_columns = await read_sql(COLUMN_TYPES_QUERY, engine,
+                                    schema_name=db_schema, table_name=db_table)
+        column_types = column_types_from_rows(db_columns.itertuples(index=False))
+        timezone = (await read_sql(TIMEZONE_QUERY, engine))['timezone'][0]
+
+    async with engine.begin() as conn:
+        raw_connection = await conn.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        for iter_ in range(0, len(data), chunksize):
+            rows_chunk = data[iter_: iter_ + chunksize]
+            chunk_start = time.perf_counter()
+            if mode == 'copy':
+                payload = encode_csv_copy(rows_chunk).encode('utf-8')
+                encode_seconds = time.perf_counter() - chunk_start
+                await driver_connection.copy_to_table(
+                    db_table, source=io.BytesIO(payload), columns=columns,
+                    schema_name=db_schema, format='csv', null=COPY_NULL
+                )
+                nbytes = len(payload)
+            elif mode == 'binary':
+                payload = encode_binary_copy(rows_chunk, column_types, timezone=timezone)
+                encode_seconds = time.perf_counter() - chunk_start
+                await driver_connection.copy_to_table(
+                    db_table, source=io.BytesIO(payload), columns=columns,
+                    schema_name=db_schema, format='binary'
+                )
+                nbytes = len(payload)
+            else:
+                write_statement = INSERT_STATEMENT.format(
+                    schema_table=table_, columns=', '.join(columns),
+                    table_values=', '.join(['${idx}'.format(idx=idx + 1)
+                                            for idx in range(len(columns))])
+                )
+                records = __insert_records(rows_chunk)
+                encode_seconds = time.perf_counter() - chunk_start
+                await driver_connection.executemany(write_statement, records)
+                nbytes = int(rows_chunk.memory_usage(index=False).sum())
+            metrics.record_chunk(rows=len(rows_chunk), nbytes=nbytes,
+                                 seconds=time.perf_counter() - chunk_start,
+                                 encode_seconds=encode_seconds)
+
+    metrics.total_seconds = time.perf_counter() - start
+    LOGGER.info('committed %s rows to %s in %.3f seconds (%.0f rows/sec)',
+                metrics.rows_written, table_, metrics.total_seconds, metrics.rows_per_second)
+    return metrics
+
+
+async def run_sql(sql_text: str, engine: AsyncEngine, **parameters) -> bool:
+    """
+    run a sql which doesn't return a value, database errors roll the transaction
+    back and are raised like db_utils.run_sql does
+    :param sql_text: input sql test
+    :param engine: sqlalchemy async engine object
+    :param parameters: (optional) parameters as key-value pairs
+        (usage: date = test_date)
+    :return: True
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(sql_text), parameters)
+    return True
+
+
+async def __get_db_object(object_name: str, engine: AsyncEngine, schema_name: str = None,
+                          is_table: bool = True) -> str:
+    """
+    check for schema name and table name against the cached catalog of the engine,
+    the catalog is loaded through the async engine when expired or on a miss
+    :param object_name: objectname (stored procedure, table)
+    :param engine: sqlalchemy async engine
+    :param schema_name: schema_name (if table is object)
+    :param is_table: whether the object is table
+    :return: str of full object_name (SCHEMA_NAME.OBJECT_NAME)
+    """
+    catalog = get_catalog_cache(engine.sync_engine)
+    if not catalog.is_expired():
+        try:
+            return catalog.resolve_many([object_name], schema_name=schema_name,
+                                        is_table=is_table, refresh=False)[object_name]
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    async with engine.connect() as conn:
+        result = await conn.execute(text(CATALOG_QUERY))
+        catalog.load(result.fetchall())
+    return catalog.resolve_many([object_name], schema_name=schema_name,
+                                is_table=is_table, refresh=False)[object_name]
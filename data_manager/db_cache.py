@@ -0,0 +1,453 @@
+"""
+Caches for database lookups
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine.base import Engine
+
+CATALOG_TTL = 300
+CATALOG_QUERY = """
+    select 'schema' as object_type, schema_name, null as object_name
+    from information_schema.schemata
+    union all
+    select 'table' as object_type, table_schema as schema_name, table_name as object_name
+    from information_schema.tables
+    where
+        table_type = 'BASE TABLE' and table_schema NOT IN (
+            'pg_catalog', 'information_schema'
+        )
+    union all
+    select distinct 'function' as object_type, n.nspname as schema_name,
+        p.proname as object_name
+    FROM    pg_catalog.pg_namespace n JOIN pg_catalog.pg_proc p
+        ON pronamespace = n.oid
+    WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+"""
+FUNCTION_SCHEMA = 'public'
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL = 60
+QUOTED_TEXT = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+WHITESPACE = re.compile(r'\s+')
+TABLE_REFERENCE = re.compile(r'\b(?:from|join)\s+((?:"?\w+"?\.)?"?\w+"?)', re.IGNORECASE)
+
+__CATALOG_CACHES = weakref.WeakKeyDictionary()
+__CATALOG_CACHES_LOCK = threading.Lock()
+
+
+class CatalogCache:
+    """
+    schemas, tables and functions of a database, loaded with one catalog query
+    and kept for ttl seconds
+    """
+    def __init__(self, engine: Engine, ttl: float = CATALOG_TTL):
+        """
+        constructor for the class
+        :param engine: sqlalchemy engine
+        :param ttl: seconds before the catalog is loaded again (None never expires)
+        """
+        self.engine = engine
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._schemas = set()
+        self._tables = dict()
+        self._functions = dict()
+
+    def refresh(self):
+        """
+        load the catalog from the database
+        """
+        conn = self.engine.connect()
+        try:
+            result = conn.execute(text(CATALOG_QUERY))
+            rows = result.fetchall()
+            result.close()
+        finally:
+            conn.close()
+        self.load(rows)
+
+    def load(self, rows):
+        """
+        replace the cached catalog with the rows of CATALOG_QUERY
+        :param rows: iterable of (object_type, schema_name, object_name)
+        """
+        schemas, tables, functions = set(), dict(), dict()
+        for object_type, schema_name, object_name in rows:
+            if object_type == 'schema':
+                schemas.add(schema_name)
+            elif object_type == 'table':
+                tables.setdefault(object_name, list()).append(schema_name)
+            else:
+                functions.setdefault(object_name, list()).append(schema_name)
+
+        for schema_names in list(tables.values()) + list(functions.values()):
+            schema_names.sort()
+        with self._lock:
+            self._schemas, self._tables, self._functions = schemas, tables, functions
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """
+        drop the cached catalog, the next lookup loads it again
+        """
+        with self._lock:
+            self._loaded_at = None
+
+    def is_expired(self) -> bool:
+        """
+        :return: whether the catalog needs to be loaded
+        """
+        if self._loaded_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+    def resolve(self, object_name: str, schema_name: str = None,
+                is_table: bool = True) -> str:
+        """
+        full name of a table or function
+        :param object_name: objectname (stored procedure, table)
+        :param schema_name: schema_name (if table is object)
+        :param is_table: whether the object is table
+        :return: str of full object_name (SCHEMA_NAME.OBJECT_NAME)
+        """
+        return self.resolve_many([object_name], schema_name=schema_name,
+                                 is_table=is_table)[object_name]
+
+    def resolve_many(self, object_names: List[str], schema_name: str = None,
+                     is_table: bool = True, refresh: bool = True) -> Dict[str, str]:
+        """
+        full names of many tables or functions, objects missing from the cached
+        catalog load it again once before failing
+        :param object_names: list of objectnames (stored procedures, tables)
+        :param schema_name: schema_name (if table is object)
+        :param is_table: whether the objects are tables
+        :param refresh: load the catalog when it is expired or misses an object,
+            callers which load it themselves (ex. async engines) pass False
+        :return: dict of object_name -> full object_name (SCHEMA_NAME.OBJECT_NAME)
+        """
+        if any(object_name is None for object_name in object_names):
+            raise Exception('Objectname cannot be null')
+
+        if not refresh:
+            return self.__resolve_many(object_names, schema_name, is_table)
+        if self.is_expired():
+            self.refresh()
+        try:
+            return self.__resolve_many(object_names, schema_name, is_table)
+        except Exception:  # pylint: disable=broad-except
+            self.refresh()
+        return self.__resolve_many(object_names, schema_name, is_table)
+
+    def __resolve_many(self, object_names: List[str], schema_name: str,
+                       is_table: bool) -> Dict[str, str]:
+        """
+        resolve names against the loaded catalog
+        """
+        with self._lock:
+            schemas = self._schemas
+            objects = self._tables if is_table else self._functions
+
+        if schema_name is not None and schema_name.lower() not in schemas:
+            raise Exception('Schema name: {schema} not found'.format(schema=schema_name))
+        if schema_name is None and not is_table:
+            schema_name = FUNCTION_SCHEMA
+
+        out_ = dict()
+        for object_name in object_names:
+            schema_names = objects.get(object_name.lower(), list())
+            if schema_name is not None:
+                schema_names = [name for name in schema_names if name == schema_name.lower()]
+            if not schema_names:
+                raise Exception('specified object not found: {object_}'.format(
+                    object_=object_name))
+            out_[object_name] = schema_names[0] + '.' + object_name.lower()
+        return out_
+
+
+class QueryCache:
+    """
+    in-process cache of query results with LRU eviction and a TTL per entry.
+    Keys are the sql text with whitespace normalized outside quoted literals,
+    the bound parameters and the read options, entries remember the tables
+    their query reads from
+    """
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        """
+        constructor for the class
+        :param maxsize: maximum number of cached results
+        :param ttl: default seconds an entry is valid for (None never expires)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(sql_text: str, parameters: Dict[str, Any], engine: Engine = None,
+                 **options) -> Tuple:
+        """
+        cache key of a query
+        :param sql_text: sql text
+        :param parameters: bound parameters
+        :param engine: sqlalchemy engine the query runs on
+        :param options: read options which change the result (ex. mode)
+        :return: hashable key
+        """
+        return (
+            str(engine.url) if engine is not None else None,
+            QueryCache.normalize_sql(sql_text),
+            tuple(sorted((key, repr(value)) for key, value in parameters.items())),
+            tuple(sorted((key, repr(value)) for key, value in options.items())),
+        )
+
+    @staticmethod
+    def normalize_sql(sql_text: str) -> str:
+        """
+        sql text with runs of whitespace collapsed to one space and the trailing
+        semicolon removed, quoted literals and identifiers are kept as they are
+        :param sql_text: sql text
+        :return: normalized sql text
+        """
+        parts = QUOTED_TEXT.split(sql_text)
+        parts[::2] = [WHITESPACE.sub(' ', part) for part in parts[::2]]
+        return ''.join(parts).strip().rstrip(';').rstrip()
+
+    @staticmethod
+    def query_tables(sql_text: str) -> set:
+        """
+        tables a query reads from, with and without schema
+        :param sql_text: sql text
+        :return: set of lower case table names
+        """
+        tables = {name.replace('"', '').lower() for name in TABLE_REFERENCE.findall(sql_text)}
+        return tables | {name.split('.', 1)[-1] for name in tables}
+
+    def get(self, key: Tuple):
+        """
+        cached result of a key
+        :param key: cache key
+        :return: a copy of the cached dataframe or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0].copy()
+
+    def put(self, key: Tuple, value, ttl: float = None):
+        """
+        cache a result
+        :param key: cache key
+        :param value: pandas dataframe
+        :param ttl: seconds the entry is valid for (default is the cache ttl)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        tables = self.query_tables(key[1])
+        with self._lock:
+            self._entries[key] = (value.copy(), expires, tables)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table_name: str = None) -> int:
+        """
+        drop cached results
+        :param table_name: drop only the results of queries reading this table,
+            with or without schema (default is all results)
+        :return: number of dropped entries
+        """
+        with self._lock:
+            if table_name is None:
+                keys = list(self._entries)
+            else:
+                table_name = table_name.replace('"', '').lower()
+                keys = [key for key, entry in self._entries.items() if table_name in entry[2]]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dict of hits, misses, evictions and current size
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        size=len(self._entries))
+
+
+class DiskQueryCache(QueryCache):
+    """
+    query result cache persisted to a local directory as uncompressed feather
+    (arrow) files which are memory mapped back on a hit, so results survive
+    process restarts. Pass a freshness token with the query (ex. the load date
+    of the underlying data) so stale results are never matched.
+    Needs pyarrow (pip install data_manager[cache])
+    """
+    def __init__(self, cache_dir: str, maxsize: int = QUERY_CACHE_SIZE, ttl: float = None):
+        """
+        constructor for the class
+        :param cache_dir: directory for the cached results, created if missing
+        :param maxsize: maximum number of cached results, least recently used
+            files are removed past it
+        :param ttl: default seconds an entry is valid for (default never expires)
+        """
+        try:
+            from pyarrow import feather  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError('DiskQueryCache needs pyarrow, '
+                              'run: pip install data_manager[cache]') from error
+        super(DiskQueryCache, self).__init__(maxsize=maxsize, ttl=ttl)
+        self._feather = feather
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __paths(self, key: Tuple) -> Tuple[str, str]:
+        """
+        data and metadata file of a key
+        """
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return (os.path.join(self.cache_dir, name + '.feather'),
+                os.path.join(self.cache_dir, name + '.json'))
+
+    def get(self, key: Tuple):
+        """
+        cached result of a key
+        :param key: cache key
+        :return: the memory mapped dataframe or None on a miss
+        """
+        data_path, meta_path = self.__paths(key)
+        try:
+            with open(meta_path) as file_:
+                meta = json.load(file_)
+            if meta['expires'] is not None and meta['expires'] < time.time():
+                self.__remove(meta_path)
+                raise FileNotFoundError(meta_path)
+            out_ = self._feather.read_table(data_path, memory_map=True).to_pandas()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return out_
+
+    def put(self, key: Tuple, value, ttl: float = None):
+        """
+        cache a result, files are written under a temporary name and renamed
+        so a concurrent reader never sees a partial file
+        :param key: cache key
+        :param value: pandas dataframe
+        :param ttl: seconds the entry is valid for (default is the cache ttl)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        data_path, meta_path = self.__paths(key)
+        meta = dict(sql=key[1], tables=sorted(self.query_tables(key[1])),
+                    expires=None if ttl is None else time.time() + ttl)
+        suffix = '.{pid}.{thread}.tmp'.format(pid=os.getpid(), thread=threading.get_ident())
+        self._feather.write_feather(value.reset_index(drop=True), data_path + suffix,
+                                    compression='uncompressed')
+        os.replace(data_path + suffix, data_path)
+        with open(meta_path + suffix, 'w') as file_:
+            json.dump(meta, file_)
+        os.replace(meta_path + suffix, meta_path)
+
+        meta_paths = self.__meta_paths()
+        if len(meta_paths) > self.maxsize:
+            meta_paths.sort(key=os.path.getmtime)
+            for path in meta_paths[:len(meta_paths) - self.maxsize]:
+                self.__remove(path)
+                with self._lock:
+                    self.evictions += 1
+
+    def invalidate(self, table_name: str = None) -> int:
+        """
+        remove cached results
+        :param table_name: remove only the results of queries reading this table,
+            with or without schema (default is all results)
+        :return: number of removed entries
+        """
+        removed = 0
+        table_name = None if table_name is None else table_name.replace('"', '').lower()
+        for meta_path in self.__meta_paths():
+            if table_name is not None:
+                try:
+                    with open(meta_path) as file_:
+                        if table_name not in json.load(file_)['tables']:
+                            continue
+                except (OSError, ValueError):
+                    continue
+            self.__remove(meta_path)
+            removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: dict of hits, misses, evictions and current size
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                        size=len(self.__meta_paths()))
+
+    def __meta_paths(self) -> List[str]:
+        """
+        metadata files in the cache directory
+        """
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith('.json')]
+
+    @staticmethod
+    def __remove(meta_path: str):
+        """
+        remove the metadata and data file of an entry
+        """
+        for path in (meta_path, meta_path[:-len('.json')] + '.feather'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def get_catalog_cache(engine: Engine, ttl: float = CATALOG_TTL) -> CatalogCache:
+    """
+    catalog cache of an engine, created on first use
+    :param engine: sqlalchemy engine
+    :param ttl: seconds before the catalog is loaded again, applied on creation
+    :return: CatalogCache
+    """
+    with __CATALOG_CACHES_LOCK:
+        if engine not in __CATALOG_CACHES:
+            __CATALOG_CACHES[engine] = CatalogCache(engine, ttl=ttl)
+        return __CATALOG_CACHES[engine]
+
+
+def invalidate_catalog_cache(engine: Engine = None):
+    """
+    drop the cached catalog of an engine, or of every engine
+    :param engine: sqlalchemy engine (default is all engines)
+    """
+    with __CATALOG_CACHES_LOCK:
+        caches = list(__CATALOG_CACHES.values()) if engine is None \
+            else [__CATALOG_CACHES[engine]] if engine in __CATALOG_CACHES else list()
+    for cache in caches:
+        cache.invalidate()
@@ -0,0 +1,471 @@
+"""
+PostgreSQL binary COPY encoding for pandas dataframes.
+Values are encoded column-wise from numpy arrays into the wire format
+so no per value text formatting happens on the load path
+"""
+# pylint: disable=too-many-locals
+import hashlib
+import uuid
+from decimal import Context, Decimal, ROUND_HALF_UP
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .db_types import NUMERIC_OID, NUMERIC_SCALE, numeric_series_to_fixed
+
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00\x00\x00\x00' + b'\x00\x00\x00\x00'
+COPY_TRAILER = b'\xff\xff'
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+PG_EPOCH_DATE = np.datetime64('2000-01-01', 'D')
+NUMERIC_NBASE = 10000
+NUMERIC_NEG = 0x4000
+INT64_LIMIT = 2.0 ** 63
+# rounding of the server, precision of the largest declared numeric column
+NUMERIC_CONTEXT = Context(prec=1000, rounding=ROUND_HALF_UP)
+
+FIXED_WIDTH_TYPES = {
+    'int2': '>i2',
+    'int4': '>i4',
+    'int8': '>i8',
+    'float4': '>f4',
+    'float8': '>f8',
+    'bool': '?',
+}
+TEXT_TYPES = ('text', 'varchar', 'bpchar', 'name')
+# postgres binary send functions giving the same bytes as encode_column, numeric values
+# are hashed through their text as the binary encoding is not canonical
+SEND_FUNCTIONS = {
+    'int2': 'int2send',
+    'int4': 'int4send',
+    'int8': 'int8send',
+    'float4': 'float4send',
+    'float8': 'float8send',
+    'bool': 'boolsend',
+    'timestamp': 'timestamp_send',
+    'timestamptz': 'timestamptz_send',
+    'date': 'date_send',
+    'text': 'textsend',
+    'varchar': 'varcharsend',
+    'bpchar': 'bpcharsend',
+    'name': 'namesend',
+}
+COPY_NULL = '\\N'
+# postgres prints fractional seconds only when non zero, pandas 2 needs format='ISO8601'
+# to parse such mixed values (the format does not exist before pandas 2, which infers it)
+DATETIME_PARSE_OPTIONS = dict(format='ISO8601') if int(pd.__version__.split('.')[0]) >= 2 \
+    else dict()
+
+# postgres type oid -> pandas dtype for COPY TO reads
+OID_DTYPES = {
+    16: 'boolean',
+    20: 'Int64',
+    21: 'Int16',
+    23: 'Int32',
+    700: 'float32',
+    701: 'float64',
+    1700: 'float64',
+    1082: 'datetime64[ns]',
+    1114: 'datetime64[ns]',
+    1184: 'datetime64[ns, UTC]',
+}
+
+
+def encode_csv_copy(data: pd.DataFrame) -> str:
+    """
+    encode a dataframe as csv for COPY ... FROM STDIN WITH (FORMAT csv, NULL '\\N')
+    :param data: pandas dataframe, columns in the order of the COPY statement
+    :return: csv text without header
+    """
+    # whole number float columns (ex. integer columns holding nulls) are written as
+    # integers so "1.0" is not sent to an integer column
+    float_columns = data.select_dtypes(include='floating').columns
+    int_columns = [
+        column for column in float_columns
+        if (data[column].dropna() % 1 == 0).all() and
+        (data[column].abs().max() < INT64_LIMIT or data[column].isna().all())
+    ]
+    if int_columns:
+        data = data.astype({column: 'Int64' for column in int_columns})
+    data, marker = __mark_null_literals(data)
+    out_ = data.to_csv(index=False, header=False, na_rep=COPY_NULL)
+    if marker is not None:
+        out_ = out_.replace(marker, '"{null}"'.format(null=COPY_NULL))
+    return out_
+
+
+def __mark_null_literals(data: pd.DataFrame):
+    """
+    text values equal to the NULL marker would load as null unless quoted, they are
+    replaced by a marker the caller swaps for the quoted value in the csv text
+    :param data: pandas dataframe
+    :return: (pandas dataframe, marker or None when no value needs quoting)
+    """
+    masks = dict()
+    for column in data.columns:
+        if data[column].dtype == object or isinstance(data[column].dtype, pd.StringDtype):
+            mask = (data[column] == COPY_NULL).fillna(False).to_numpy(dtype=bool)
+            if mask.any():
+                masks[column] = mask
+    if not masks:
+        return data, None
+
+    # backslashes only come from text values, which are checked not to hold the marker
+    marker = COPY_NULL + uuid.uuid4().hex
+    while any(data[column].astype(str).str.contains(marker, regex=False).any()
+              for column in masks):
+        marker = COPY_NULL + uuid.uuid4().hex
+    return data.assign(**{column: data[column].mask(mask, marker)
+                          for column, mask in masks.items()}), marker
+
+
+def column_types_from_rows(rows) -> Dict[str, Tuple[str, int]]:
+    """
+    column types for encode_binary_copy from information_schema.columns rows
+    :param rows: iterable of (column_name, udt_name, numeric_scale)
+    :return: dict of column name -> (udt_name, numeric_scale)
+    """
+    return {
+        column_name: (udt_name, None if pd.isna(numeric_scale) else int(numeric_scale))
+        for column_name, udt_name, numeric_scale in rows
+    }
+
+
+def encode_binary_copy(data: pd.DataFrame, column_types: Dict[str, Tuple[str, int]],
+                       timezone: str = None) -> bytes:
+    """
+    encode a dataframe into a complete PostgreSQL binary COPY payload
+    :param data: pandas dataframe, columns in the order of the COPY statement
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :param timezone: (optional) TimeZone of the session, naive values of timestamptz
+        columns are read in it like the csv and insert paths do
+    :return: bytes which can be streamed to COPY ... FROM STDIN WITH (FORMAT binary)
+    """
+    return __binary_rows(data, column_types, timezone=timezone)[0].tobytes()
+
+
+def __binary_rows(data: pd.DataFrame, column_types: Dict[str, Tuple[str, int]],
+                  timezone: str = None):
+    """
+    encode a dataframe into a binary COPY payload
+    :param data: pandas dataframe, columns in the order of the COPY statement
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :param timezone: (optional) TimeZone of the session for naive timestamptz values
+    :return: (uint8 payload, byte offset of each row, byte size of each row)
+    """
+    n_rows = len(data)
+    n_cols = len(data.columns)
+    payloads = list()
+    lengths = np.empty((n_rows, n_cols), dtype=np.int64)
+    for idx, column in enumerate(data.columns):
+        if column not in column_types:
+            raise ValueError('column not found in target table: {column}'.format(column=column))
+        udt_name, scale = column_types[column]
+        payload, lengths[:, idx] = encode_column(data[column], udt_name, scale, timezone)
+        payloads.append(payload)
+
+    field_sizes = 4 + np.maximum(lengths, 0)
+    row_sizes = 2 + field_sizes.sum(axis=1)
+    row_starts = len(COPY_HEADER) + np.concatenate(([0], np.cumsum(row_sizes)[:-1]))
+    total_size = len(COPY_HEADER) + int(row_sizes.sum()) + len(COPY_TRAILER)
+
+    out_ = np.empty(total_size, dtype=np.uint8)
+    out_[:len(COPY_HEADER)] = np.frombuffer(COPY_HEADER, dtype=np.uint8)
+    out_[total_size - len(COPY_TRAILER):] = np.frombuffer(COPY_TRAILER, dtype=np.uint8)
+    if n_rows == 0:
+        return out_, row_starts, row_sizes
+
+    __scatter(out_, row_starts, np.full(n_rows, n_cols, dtype='>i2'))
+    field_starts = row_starts[:, None] + 2 + np.concatenate(
+        (np.zeros((n_rows, 1), dtype=np.int64), np.cumsum(field_sizes, axis=1)[:, :-1]),
+        axis=1
+    )
+    for idx, payload in enumerate(payloads):
+        __scatter(out_, field_starts[:, idx], lengths[:, idx].astype('>i4'))
+        not_null = lengths[:, idx] >= 0
+        data_starts = field_starts[not_null, idx] + 4
+        data_lengths = lengths[not_null, idx]
+        if data_lengths.size == 0:
+            continue
+        offsets = np.concatenate(([0], np.cumsum(data_lengths)[:-1]))
+        positions = np.repeat(data_starts - offsets, data_lengths) + np.arange(payload.size)
+        out_[positions] = payload
+    return out_, row_starts, row_sizes
+
+
+def row_hash_expression(columns, column_types: Dict[str, Tuple[str, int]]) -> str:
+    """
+    sql expression of the md5 row hash given by row_hashes for the rows of a table
+    :param columns: columns hashed, in order
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :return: sql text
+    """
+    fields = list()
+    for column in columns:
+        udt_name, _ = __hash_type(column, column_types)
+        if udt_name == 'numeric':
+            value = 'textsend({column}::text)'.format(column=column)
+        else:
+            value = '{send}({column})'.format(send=SEND_FUNCTIONS[udt_name], column=column)
+        fields.append('coalesce(int4send(length({value})) || {value}, int4send(-1))'.format(
+            value=value))
+    return 'md5({fields})'.format(fields=' || '.join(fields))
+
+
+def row_hashes(data: pd.DataFrame, column_types: Dict[str, Tuple[str, int]],
+               timezone: str = None) -> np.ndarray:
+    """
+    md5 hash of every row over its binary COPY fields, equal to the hash given
+    by row_hash_expression for the same values stored in the table
+    :param data: pandas dataframe
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :param timezone: (optional) TimeZone of the session for naive timestamptz values
+    :return: numpy array of hex digests
+    """
+    hash_types = dict()
+    for column in data.columns:
+        udt_name, scale = __hash_type(column, column_types)
+        if udt_name == 'numeric':
+            data = data.assign(**{column: __numeric_text(data[column], scale)})
+            udt_name = 'text'
+        hash_types[column] = (udt_name, scale)
+    out_, row_starts, row_sizes = __binary_rows(data, hash_types, timezone=timezone)
+    buffer_ = memoryview(out_)
+    return np.array([
+        hashlib.md5(buffer_[start + 2: start + size]).hexdigest()
+        for start, size in zip(row_starts.tolist(), row_sizes.tolist())
+    ], dtype=object)
+
+
+def __hash_type(column: str, column_types: Dict[str, Tuple[str, int]]) -> Tuple[str, int]:
+    """
+    type of a column in a row hash
+    :param column: column name
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :return: (udt_name, numeric scale)
+    """
+    if column not in column_types:
+        raise ValueError('column not found in target table: {column}'.format(column=column))
+    udt_name, scale = column_types[column]
+    if udt_name != 'numeric' and udt_name not in SEND_FUNCTIONS:
+        raise ValueError('row hashes do not support column type: {udt_name}'.format(
+            udt_name=udt_name))
+    return udt_name, scale
+
+
+def __numeric_text(series: pd.Series, scale: int) -> pd.Series:
+    """
+    text of numeric values as postgres prints them for a column of the given scale
+    :param series: pandas series
+    :param scale: numeric scale of the column (None keeps the values as given)
+    :return: pandas series of strings (nulls kept)
+    """
+    valid = series.dropna()
+    if scale is None:
+        text_ = valid.astype(str)
+    else:
+        quantum = Decimal(1).scaleb(-scale)
+        text_ = valid.map(lambda value: str(Decimal(str(value)).quantize(
+            quantum, context=NUMERIC_CONTEXT)))
+    return text_.reindex(series.index).astype(object)
+
+
+def encode_column(series: pd.Series, udt_name: str, scale: int = None, timezone: str = None):
+    """
+    encode one column into the binary field values of a COPY payload
+    :param series: pandas series
+    :param udt_name: postgres type name of the target column
+    :param scale: numeric scale of the target column (numeric columns only)
+    :param timezone: TimeZone of the session naive values of timestamptz columns are in,
+        naive values are rejected without it
+    :return: (uint8 array of the non null values back to back,
+        int64 array of field lengths with -1 for null)
+    """
+    null_mask = series.isna().to_numpy()
+    valid = series[~null_mask]
+
+    if udt_name in FIXED_WIDTH_TYPES:
+        dtype = np.dtype(FIXED_WIDTH_TYPES[udt_name])
+        if udt_name.startswith('int'):
+            values = __to_integer(valid, udt_name).astype(dtype)
+        elif udt_name == 'bool':
+            values = valid.to_numpy(dtype=bool)
+        else:
+            values = valid.to_numpy(dtype=np.float64).astype(dtype)
+        payload = values.view(np.uint8)
+        width = dtype.itemsize
+    elif udt_name in ('timestamp', 'timestamptz'):
+        values = __to_datetime(valid, timezone=timezone if udt_name == 'timestamptz' else None,
+                               to_utc=udt_name == 'timestamptz')
+        micros = (values.astype('datetime64[us]') - PG_EPOCH).astype(np.int64)
+        payload = micros.astype('>i8').view(np.uint8)
+        width = 8
+    elif udt_name == 'date':
+        values = __to_datetime(valid, timezone=None, to_utc=False)
+        days = (values.astype('datetime64[D]') - PG_EPOCH_DATE).astype(np.int64)
+        payload = days.astype('>i4').view(np.uint8)
+        width = 4
+    elif udt_name == 'numeric':
+        payload, width = __encode_numeric(valid, scale)
+    elif udt_name in TEXT_TYPES:
+        encoded = [str(value).encode('utf-8') for value in valid]
+        lengths = np.full(len(series), -1, dtype=np.int64)
+        lengths[~null_mask] = [len(value) for value in encoded]
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), lengths
+    else:
+        raise ValueError('binary copy does not support column type: {udt_name}'.format(
+            udt_name=udt_name))
+
+    lengths = np.where(null_mask, -1, width).astype(np.int64)
+    return np.ascontiguousarray(payload).reshape(-1), lengths
+
+
+def __to_integer(valid: pd.Series, udt_name: str) -> np.ndarray:
+    """
+    convert a series to int64 values, fractional values are rejected instead of truncated
+    :param valid: pandas series without nulls
+    :param udt_name: postgres type name of the target column
+    :return: numpy int64 array
+    """
+    values = valid.to_numpy()
+    if values.dtype.kind in 'iub':
+        return values.astype(np.int64)
+    floats = valid.to_numpy(dtype=np.float64)
+    fractional = ~np.isfinite(floats) | (floats != np.trunc(floats))
+    if fractional.any():
+        raise ValueError('non integer values for {udt_name} column: {values}'.format(
+            udt_name=udt_name, values=valid[fractional].head().tolist()))
+    if values.dtype.kind == 'f':
+        return floats.astype(np.int64)
+    return valid.to_numpy(dtype=np.int64)
+
+
+def __to_datetime(valid: pd.Series, timezone: str, to_utc: bool) -> np.ndarray:
+    """
+    convert a series to naive datetime64 values,
+    timezone aware values are converted to UTC for timestamptz targets, naive values
+    of timestamptz targets are localized to the session timezone first
+    :param valid: pandas series without nulls
+    :param timezone: TimeZone of the session for naive values of timestamptz targets
+    :param to_utc: convert timezone aware values to UTC
+    :return: numpy datetime64[ns] array
+    """
+    values = pd.to_datetime(valid)
+    if to_utc and len(values) and getattr(values.dt, 'tz', None) is None:
+        if timezone is None:
+            raise ValueError('naive timestamps for a timestamptz column need the '
+                             'session timezone')
+        values = values.dt.tz_localize(timezone)
+    if getattr(values.dt, 'tz', None) is not None:
+        if to_utc:
+            values = values.dt.tz_convert('UTC')
+        values = values.dt.tz_localize(None)
+    return values.to_numpy(dtype='datetime64[ns]')
+
+
+def __encode_numeric(valid: pd.Series, scale: int):
+    """
+    encode numeric values with a fixed scale. Every value of the column is laid out
+    with the same number of base 10000 digits (leading zeros are stripped by the server)
+    so the column can be built as one fixed width block
+    :param valid: pandas series without nulls
+    :param scale: numeric scale of the target column
+    :return: (uint8 payload, field width in bytes)
+    """
+    if scale is None:
+        raise ValueError('binary copy needs a numeric column with a declared scale, '
+                         'use mode="copy" for unconstrained numeric columns')
+
+    frac_groups = -(-scale // 4)
+    padding = 10 ** (4 * frac_groups - scale)
+    scaled = None
+    if valid.dtype != object:
+        # round half away from zero like the server and the Decimal path do
+        values = valid.to_numpy(dtype=np.float64) * 10.0 ** scale
+        if not np.all(np.isfinite(values)):
+            raise ValueError('binary copy can not encode nan or infinite numeric values')
+        rounded = np.sign(values) * np.floor(np.abs(values) + 0.5)
+        if not rounded.size or np.abs(rounded).max() < INT64_LIMIT / padding:
+            scaled = rounded.astype(np.int64) * padding
+    if scaled is None:
+        # decimals, and floats past the int64 range, are scaled exactly into python ints,
+        # floats through their shortest repr as the csv path sends them
+        quantum = Decimal(1).scaleb(-scale)
+        scaled = np.empty(len(valid), dtype=object)
+        scaled[:] = [
+            int(Decimal(str(value)).quantize(quantum, context=NUMERIC_CONTEXT).scaleb(
+                scale, context=NUMERIC_CONTEXT)) * padding
+            for value in valid
+        ]
+    signs = np.where(scaled < 0, NUMERIC_NEG, 0)
+    remainder = np.abs(scaled)
+
+    int_max = int(remainder.max()) // NUMERIC_NBASE ** frac_groups if remainder.size else 0
+    int_groups = 1
+    while int_max >= NUMERIC_NBASE:
+        int_max //= NUMERIC_NBASE
+        int_groups += 1
+    n_digits = int_groups + frac_groups
+
+    words = np.empty((remainder.size, 4 + n_digits), dtype='>i2')
+    words[:, 0] = n_digits
+    words[:, 1] = int_groups - 1
+    words[:, 2] = signs
+    words[:, 3] = scale
+    for idx in range(n_digits - 1, -1, -1):
+        words[:, 4 + idx] = remainder % NUMERIC_NBASE
+        remainder = remainder // NUMERIC_NBASE
+    return words.view(np.uint8).reshape(-1), 2 * (4 + n_digits)
+
+
+def __scatter(out_: np.ndarray, starts: np.ndarray, values: np.ndarray):
+    """
+    write fixed width big-endian values into the output buffer at the given offsets
+    :param out_: uint8 output buffer
+    :param starts: byte offset of each value
+    :param values: numpy array of fixed width values
+    """
+    width = values.dtype.itemsize
+    out_[starts[:, None] + np.arange(width)] = values.view(np.uint8).reshape(-1, width)
+
+
+def decode_csv_copy(buffer_, description, numeric_dtype: str = 'float64',
+                    numeric_scale: int = NUMERIC_SCALE) -> pd.DataFrame:
+    """
+    parse the output of COPY (query) TO STDOUT WITH (FORMAT csv) into typed columns.
+    Column dtypes come from the type oids of the query so pandas does not infer them
+    and the C parser fills numpy arrays without building python objects per row
+    :param buffer_: file like object with the csv COPY output
+    :param description: psycopg2 cursor description of the query
+    :param numeric_dtype: decoding of NUMERIC columns, 'float64', 'int64'
+        (scaled fixed point) or 'decimal' (default is float64)
+    :param numeric_scale: number of decimals kept by the int64 policy
+    :return: pandas dataframe
+    """
+    columns = [column.name for column in description]
+    dtypes = dict()
+    datetime_columns = list()
+    numeric_columns = list()
+    for idx, column in enumerate(description):
+        pandas_type = OID_DTYPES.get(column.type_code, object)
+        if pandas_type in ('datetime64[ns]', 'datetime64[ns, UTC]'):
+            datetime_columns.append((idx, pandas_type))
+            pandas_type = object
+        elif column.type_code == NUMERIC_OID and numeric_dtype != 'float64':
+            numeric_columns.append(idx)
+            pandas_type = object
+        dtypes[idx] = pandas_type
+
+    out_ = pd.read_csv(buffer_, header=None, names=list(range(len(columns))),
+                       dtype=dtypes, na_values=[COPY_NULL], keep_default_na=False,
+                       true_values=['t'], false_values=['f'])
+    for idx, pandas_type in datetime_columns:
+        out_[idx] = pd.to_datetime(out_[idx], utc=pandas_type == 'datetime64[ns, UTC]',
+                                   **DATETIME_PARSE_OPTIONS)
+    for idx in numeric_columns:
+        if numeric_dtype == 'int64':
+            out_[idx] = numeric_series_to_fixed(out_[idx], numeric_scale)
+        else:
+            out_[idx] = [None if pd.isna(value) else Decimal(value) for value in out_[idx]]
+    out_.columns = columns
+    return out_
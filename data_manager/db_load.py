@@ -0,0 +1,155 @@
+"""
+Helpers for bulk loads through db_utils.to_sql
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import numpy as np
+
+TARGET_BATCH_BYTES = 16 * 1024 * 1024
+TARGET_BATCH_SECONDS = 1.0
+MIN_CHUNKSIZE = 1000
+MAX_CHUNKSIZE = 500000
+INITIAL_CHUNKSIZE = 10000
+MAX_GROWTH = 4.0
+
+
+class ChunkSizeTuner:
+    """
+    adaptive chunk size for to_sql. After every chunk the measured bytes per row and
+    rows per second give the row count meeting both the target batch size and
+    the target batch latency, the next chunk size moves towards the smaller of the two
+    (usage: to_sql(data, engine, table_name, chunksize='auto'))
+    """
+    def __init__(self, target_bytes: int = TARGET_BATCH_BYTES,
+                 target_seconds: float = TARGET_BATCH_SECONDS,
+                 initial_chunksize: int = INITIAL_CHUNKSIZE,
+                 min_chunksize: int = MIN_CHUNKSIZE, max_chunksize: int = MAX_CHUNKSIZE):
+        """
+        constructor for the class
+        :param target_bytes: bytes sent to the server per chunk
+        :param target_seconds: seconds to encode and write one chunk
+        :param initial_chunksize: rows in the first chunk
+        :param min_chunksize: lower bound of the chunk size
+        :param max_chunksize: upper bound of the chunk size
+        """
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.min_chunksize = min_chunksize
+        self.max_chunksize = max_chunksize
+        self._chunksize = max(min_chunksize, min(initial_chunksize, max_chunksize))
+        self._lock = threading.Lock()
+
+    @property
+    def chunksize(self) -> int:
+        """
+        :return: rows in the next chunk
+        """
+        return self._chunksize
+
+    def observe(self, rows: int, nbytes: int, seconds: float):
+        """
+        update the chunk size from a written chunk
+        :param rows: rows in the chunk
+        :param nbytes: bytes sent for the chunk
+        :param seconds: seconds taken to encode and write the chunk
+        """
+        if rows <= 0:
+            return
+        candidates = list()
+        if nbytes:
+            candidates.append(self.target_bytes * rows / nbytes)
+        if seconds > 0:
+            candidates.append(self.target_seconds * rows / seconds)
+        if not candidates:
+            return
+
+        with self._lock:
+            current = self._chunksize
+            # move half way (geometric) towards the target so one slow chunk does not
+            # swing the size, and grow at most MAX_GROWTH times per chunk
+            target = (current * min(candidates)) ** 0.5
+            target = min(target, current * MAX_GROWTH)
+            self._chunksize = int(max(self.min_chunksize, min(target, self.max_chunksize)))
+
+
+@dataclass
+class LoadMetrics:
+    """
+    metrics of one to_sql load
+    """
+    table_name: str = None
+    rows_written: int = 0
+    rows_skipped: int = 0
+    bytes_sent: int = 0
+    chunk_count: int = 0
+    encode_seconds: float = 0.0
+    server_seconds: float = 0.0
+    total_seconds: float = 0.0
+    chunk_seconds: List[float] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def record_chunk(self, rows: int, nbytes: int, seconds: float, encode_seconds: float):
+        """
+        add a written chunk
+        :param rows: rows in the chunk
+        :param nbytes: bytes sent for the chunk
+        :param seconds: seconds taken to encode and write the chunk
+        :param encode_seconds: part of seconds spent encoding the chunk
+        """
+        with self._lock:
+            self.rows_written += rows
+            self.bytes_sent += nbytes or 0
+            self.chunk_count += 1
+            self.encode_seconds += encode_seconds
+            self.server_seconds += seconds - encode_seconds
+            self.chunk_seconds.append(seconds)
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        :return: rows written per second of the whole load
+        """
+        return self.rows_written / self.total_seconds if self.total_seconds > 0 else 0.0
+
+    def chunk_latency(self, percentile: float) -> float:
+        """
+        :param percentile: percentile between 0 and 100
+        :return: percentile of the per chunk latency in seconds
+        """
+        if not self.chunk_seconds:
+            return 0.0
+        return float(np.percentile(self.chunk_seconds, percentile))
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        :return: flat dict of the metrics for dashboards and logs
+        """
+        return dict(
+            table_name=self.table_name, rows_written=self.rows_written,
+            rows_skipped=self.rows_skipped,
+            bytes_sent=self.bytes_sent, chunk_count=self.chunk_count,
+            encode_seconds=self.encode_seconds, server_seconds=self.server_seconds,
+            total_seconds=self.total_seconds, rows_per_second=self.rows_per_second,
+            chunk_p50_seconds=self.chunk_latency(50), chunk_p90_seconds=self.chunk_latency(90),
+            chunk_p99_seconds=self.chunk_latency(99),
+        )
+
+
+@dataclass
+class BulkLoadProfile:
+    """
+    settings of a bulk load through to_sql(bulk_load=...). Non primary key indexes
+    not backing a constraint are dropped before the load and rebuilt after it,
+    the session settings apply to the load transactions
+    """
+    drop_indexes: bool = True
+    rebuild_concurrently: bool = True
+    analyze: bool = True
+    maintenance_work_mem: str = '1GB'
+    session_settings: Dict[str, str] = field(
+        default_factory=lambda: {'synchronous_commit': 'off'}
+    )
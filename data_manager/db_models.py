@@ -5,10 +5,15 @@ Methods to create SQL Alchemy connection strings and build db models
 # pylint: disable=too-many-locals, too-many-arguments
 # pylint: disable=too-few-public-methods, import-error
 
+import logging
 import os
-from typing import Any, List
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
 from dataclasses import dataclass
 
+LOGGER = logging.getLogger(__name__)
+ORM_WORKERS = 4
 HEADER_MESSAGE = '\"\"\"\n' \
                  'Database engine connections that the application ' \
                  'would connect to. \n' \
@@ -18,53 +23,108 @@ HEADER_MESSAGE = '\"\"\"\n' \
                  'to generate connection strings and orm objects ' \
                  '\"\"\"'
 PYLINT_MESSAGE = '\n# pylint: skip-file \n\n'
-IMPORT_STRINGS = 'import os \nfrom sqlalchemy import create_engine \n\n'
-CONNECTION_STRING = 'postgres://{user}:{password}@{host}:5432/{database}'
-CONNECTION_STRING_VARS = "create_engine('postgres://' + os.environ['{user}'] + ':' " \
+IMPORT_STRINGS = 'import os \nimport threading \nfrom sqlalchemy import create_engine \n'
+DEFAULT_PORT = 5432
+CONNECTION_STRING = 'postgresql://{user}:{password}@{host}:{port}/{database}'
+CONNECTION_STRING_VARS = "'postgresql://' + os.environ['{user}'] + ':' " \
                          "+ os.environ['{password}'] + " \
-                         "'@' + os.environ['{host}'] + ':5432/' + os.environ['{database}'])"
-ENGINE_STRING = '{engine_name} = {connection_string}\n\n'
+                         "'@' + os.environ['{host}'] + {port} + os.environ['{database}']"
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_recycle', 'pool_pre_ping', 'null_pool')
+NULL_POOL_IMPORT_STRING = 'from sqlalchemy.pool import NullPool \n'
+ROUTER_IMPORT_STRING = 'from data_manager.db_routing import EngineRouter \n'
+ENGINE_FACTORIES_HEADER = '# engines are created on first access and cached, ' \
+                          'so a process only pays for the engines it uses\n' \
+                          '_ENGINE_FACTORIES = {\n'
+ENGINE_STRING = "    '{engine_name}': lambda: create_engine({connection_string}{engine_options}),\n"
+ROUTER_STRING = "    '{router_name}': lambda: EngineRouter(__getattr__('{engine_name}'), " \
+                "[{replica_engines}]),\n"
+REPLICA_ENGINE_STRING = 'create_engine({connection_string}{engine_options})'
+ENGINE_FACTORIES_FOOTER = '}\n'
+LAZY_ENGINE_STRING = '_ENGINES = dict()\n' \
+                     '_ENGINES_LOCK = threading.RLock()\n\n\n' \
+                     'def __getattr__(name):\n' \
+                     '    if name not in _ENGINE_FACTORIES:\n' \
+                     "        raise AttributeError('module {module!r} has no attribute " \
+                     "{name!r}'.format(module=__name__, name=name))\n" \
+                     '    with _ENGINES_LOCK:\n' \
+                     '        if name not in _ENGINES:\n' \
+                     '            _ENGINES[name] = _ENGINE_FACTORIES[name]()\n' \
+                     '    return _ENGINES[name]\n\n\n' \
+                     'def __dir__():\n' \
+                     '    return sorted(list(globals()) + list(_ENGINE_FACTORIES))\n'
 
 
 @dataclass
 class DBModelItem:
     """
-    class for keeping inputs to database models creation
+    class for keeping inputs to database models creation.
+    db_host, db_user, db_password, db_database and db_port are names of os.environment
+    variables. The pool options left as None take the values given to generate_db_details
+    (sqlalchemy defaults otherwise), null_pool opens a new connection per checkout for
+    deployments behind PgBouncer, pool_size and max_overflow do not apply to it.
+    db_replica_hosts are names of the host variables of read replicas, the generated
+    {db_database}_router (db_routing.EngineRouter) sends read_sql to the replicas and
+    to_sql / run_sql to the primary
     """
     db_host: str
     db_user: Any
     db_password: Any
     db_database: str
     db_schemas: List[str] = None
+    db_port: str = None
+    pool_size: int = None
+    max_overflow: int = None
+    pool_recycle: int = None
+    pool_pre_ping: bool = None
+    null_pool: bool = None
+    db_replica_hosts: List[str] = None
 
 
-def __build_orm_models(db_model_item: DBModelItem, output_path: str, engine_string: str):
+def __build_orm_commands(db_model_item: DBModelItem, output_path: str,
+                         engine_string: str) -> List[Tuple[str, List[str]]]:
     """
-    Method to build ORM classes for a given connection string at a given path
+    Method to build the sqlacodegen commands of the ORM classes of a database,
+    one per schema
     :param db_model_item: DB Model item details
     :param output_path: output path
     :param engine_string: sqlalchemy engine string
-    :return:
+    :return: list of (orm classes path, sqlacodegen arguments)
     """
-    if db_model_item.db_schemas is None:
-        orm_name = db_model_item.db_database.lower() + '_models.py'
-        orm_classes_path = output_path + orm_name
-        command = 'sqlacodegen --outfile ' + orm_classes_path + \
-                  ' --nojoined --noconstraints ' \
-                  ' "' + engine_string + '"'
-        os.system(command)
-    else:
-        for schema in db_model_item.db_schemas:
+    commands = list()
+    for schema in db_model_item.db_schemas or [None]:
+        if schema is None:
+            orm_name = db_model_item.db_database.lower() + '_models.py'
+        else:
             orm_name = db_model_item.db_database.lower() + '_' + schema.lower() + '_models.py'
-            orm_classes_path = output_path + orm_name
-            command = 'sqlacodegen --outfile ' + orm_classes_path + \
-                      ' --nojoined --noconstraints ' \
-                      ' --schema ' + schema + ' "' + engine_string + '"'
-            os.system(command)
+        orm_classes_path = output_path + orm_name
+        command = ['sqlacodegen', '--outfile', orm_classes_path, '--nojoined', '--noconstraints']
+        if schema is not None:
+            command += ['--schema', schema]
+        commands.append((orm_classes_path, command + [engine_string]))
+    return commands
+
+
+def __run_orm_command(orm_classes_path: str, command: List[str]) -> Tuple[int, str]:
+    """
+    Method to run one sqlacodegen command
+    :param orm_classes_path: path of the generated ORM classes
+    :param command: sqlacodegen arguments
+    :return: (exit status, error output)
+    """
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, check=False)
+    except OSError as error:
+        LOGGER.error('sqlacodegen could not be run for %s: %s', orm_classes_path, error)
+        return -1, str(error)
+    if result.returncode != 0:
+        LOGGER.error('sqlacodegen failed for %s with exit status %s: %s', orm_classes_path,
+                     result.returncode, result.stderr.strip())
+    return result.returncode, result.stderr
 
 
 def __build_connection_string(host: str, user: str, password: str, database: str,
-                              use_environment_vars: bool = True) -> str:
+                              use_environment_vars: bool = True, port: Any = None) -> str:
     """
     private method which returns connection string
     :param host: name of host variable in os.environment or host
@@ -72,48 +132,113 @@ def __build_connection_string(host: str, user: str, password: str, database: str
     :param password: name of password variable in os.environment or password
     :param database: name of password variable in os.environment or database name
     :param use_environment_vars: boolean variable
+    :param port: name of port variable in os.environment or port (default is 5432)
     :return:
     """
     connection_string = CONNECTION_STRING
     if use_environment_vars:
         connection_string = CONNECTION_STRING_VARS
+        if port is None:
+            port = "':{port}/'".format(port=DEFAULT_PORT)
+        else:
+            port = "':' + os.environ['{port}'] + '/'".format(port=port)
+    elif port is None:
+        port = DEFAULT_PORT
 
     result_string = connection_string.format(
         user=user, password=password, host=host,
-        database=database
+        database=database, port=port
     )
     return result_string
 
 
-def __build_engine_file(output_path: str, db_model_items: List[DBModelItem]):
+def __build_engine_options(db_model_item: DBModelItem, pool_options: dict) -> str:
     """
-    method which would create engine file __init__.py at a given location
+    private method which returns the create_engine keyword arguments of the pool options
+    :param db_model_item: DB Model item details
+    :param pool_options: pool option -> default value for the options not set on the item
+    :return: str of keyword arguments, each one preceded by a comma
+    """
+    options = {
+        option: getattr(db_model_item, option) if getattr(db_model_item, option) is not None
+        else pool_options.get(option) for option in POOL_OPTIONS
+    }
+    if options.pop('null_pool'):
+        # pool_size / max_overflow defaults of generate_db_details do not apply to null pools
+        if db_model_item.pool_size is not None or db_model_item.max_overflow is not None:
+            raise ValueError('null_pool can not be combined with pool_size or max_overflow: '
+                             '{database}'.format(database=db_model_item.db_database))
+        options = dict(poolclass='NullPool', pool_recycle=options['pool_recycle'],
+                       pool_pre_ping=options['pool_pre_ping'])
+        return ''.join(', {option}={value}'.format(option=option, value=value)
+                       for option, value in options.items() if value is not None)
+    return ''.join(', {option}={value!r}'.format(option=option, value=value)
+                   for option, value in options.items() if value is not None)
+
+
+def __build_engine_file(output_path: str, db_model_items: List[DBModelItem],
+                        pool_options: dict = None):
+    """
+    method which would create engine file __init__.py at a given location.
+    The engines are created lazily by a module level __getattr__ on first access
     :param output_path:
+    :param pool_options: pool option -> default value for the items
     :return:
     """
     engine_strings = list()
     for db_model_item in db_model_items:
         connection_string = __build_connection_string(
             host=db_model_item.db_host, user=db_model_item.db_user,
-            password=db_model_item.db_password, database=db_model_item.db_database
+            password=db_model_item.db_password, database=db_model_item.db_database,
+            port=db_model_item.db_port
         )
+        engine_options = __build_engine_options(db_model_item, pool_options or dict())
         engine_variable = db_model_item.db_database + '_engine'
         engine_string = ENGINE_STRING.format(engine_name=engine_variable,
-                                             connection_string=connection_string)
+                                             connection_string=connection_string,
+                                             engine_options=engine_options)
         engine_strings.append(engine_string)
 
+        if db_model_item.db_replica_hosts:
+            replica_engines = [
+                REPLICA_ENGINE_STRING.format(
+                    connection_string=__build_connection_string(
+                        host=replica_host, user=db_model_item.db_user,
+                        password=db_model_item.db_password,
+                        database=db_model_item.db_database, port=db_model_item.db_port
+                    ),
+                    engine_options=engine_options
+                ) for replica_host in db_model_item.db_replica_hosts
+            ]
+            engine_strings.append(ROUTER_STRING.format(
+                router_name=db_model_item.db_database + '_router',
+                engine_name=engine_variable, replica_engines=', '.join(replica_engines)
+            ))
+
     # writing to __init__.py file
     with open(output_path + '__init__.py', 'w') as file_:
         file_.write(HEADER_MESSAGE)
         file_.write(PYLINT_MESSAGE)
         file_.write(IMPORT_STRINGS)
+        if any('NullPool' in eng_ for eng_ in engine_strings):
+            file_.write(NULL_POOL_IMPORT_STRING)
+        if any('EngineRouter' in eng_ for eng_ in engine_strings):
+            file_.write(ROUTER_IMPORT_STRING)
+        file_.write('\n')
 
+        file_.write(ENGINE_FACTORIES_HEADER)
         for eng_ in engine_strings:
             file_.write(eng_)
+        file_.write(ENGINE_FACTORIES_FOOTER)
+        file_.write('\n')
+        file_.write(LAZY_ENGINE_STRING)
 
 
 def generate_db_details(db_model_items: List[DBModelItem], export_path: str,
-                        orm_flag: bool = True, orm_classes_path: str = None):
+                        orm_flag: bool = True, orm_classes_path: str = None,
+                        pool_size: int = None, max_overflow: int = None,
+                        pool_recycle: int = None, pool_pre_ping: bool = None,
+                        null_pool: bool = None, max_workers: int = ORM_WORKERS) -> Dict[str, int]:
     """
     Method to build DB Models and schemas
     :param export_path: path where the db engine string would be generated
@@ -121,19 +246,58 @@ def generate_db_details(db_model_items: List[DBModelItem], export_path: str,
         for which the models need to be built
     :param orm_flag: flag on whether to build orm classes or not
     :param orm_classes_path: path to store ORM classes
+    :param pool_size: (optional) connections kept open in the pool of each engine
+    :param max_overflow: (optional) connections opened above pool_size under load
+    :param pool_recycle: (optional) seconds after which a pooled connection is replaced
+    :param pool_pre_ping: (optional) test connections on checkout
+    :param null_pool: (optional) no pooling, for deployments behind PgBouncer
+        (the DBModelItem pool options take precedence over these defaults)
+    :param max_workers: number of sqlacodegen processes run at the same time
+    :return: dict of orm classes path -> sqlacodegen exit status, raises an Exception
+        with the exit statuses and the error output of the failed schemas once all
+        generations ended
     """
-    __build_engine_file(output_path=export_path, db_model_items=db_model_items)
+    pool_options = dict(pool_size=pool_size, max_overflow=max_overflow,
+                        pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping,
+                        null_pool=null_pool)
+    __build_engine_file(output_path=export_path, db_model_items=db_model_items,
+                        pool_options=pool_options)
 
+    statuses = dict()
     if orm_flag:
+        commands = list()
         for db_model_item in db_model_items:
             host = os.environ[db_model_item.db_host]
             user = os.environ[db_model_item.db_user]
             password = os.environ[db_model_item.db_password]
             database = os.environ[db_model_item.db_database]
+            port = None
+            if db_model_item.db_port is not None:
+                port = os.environ[db_model_item.db_port]
 
             engine_string = __build_connection_string(
                 host=host, user=user, password=password,
-                database=database, use_environment_vars=False
+                database=database, use_environment_vars=False, port=port
+            )
+            commands += __build_orm_commands(db_model_item=db_model_item,
+                                             output_path=orm_classes_path,
+                                             engine_string=engine_string)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda command: __run_orm_command(*command), commands))
+        statuses = {
+            path: status for (path, _), (status, _) in zip(commands, results)
+        }
+        errors = {
+            path: error.strip() for (path, _), (status, error) in zip(commands, results)
+            if status != 0
+        }
+        if errors:
+            details = '\n'.join('{path}: {error}'.format(path=path, error=error)
+                                for path, error in errors.items())
+            raise Exception(
+                'ORM generation failed for {count} of {total}, exit statuses: '
+                '{statuses}\n{details}'.format(count=len(errors), total=len(statuses),
+                                               statuses=statuses, details=details)
             )
-            __build_orm_models(db_model_item=db_model_item, output_path=orm_classes_path,
-                               engine_string=engine_string)
+    return statuses
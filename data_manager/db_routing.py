@@ -0,0 +1,111 @@
+"""
+Read/write routing of the db_utils functions across a primary engine
+and its read replicas
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List
+
+import pandas as pd
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import OperationalError
+
+from . import db_utils
+from .db_load import LoadMetrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+class EngineRouter:
+    """
+    routes read_sql to the replica engines, round robin, and to_sql / run_sql to the
+    primary engine. A replica which can not be connected to, or which drops the
+    connection during the read, is skipped for the next one, the primary serves the read
+    when no replica answers. Other errors, statement timeouts included, are raised
+    without trying the other engines. Reads which must see the
+    caller's own writes go to the primary with read_sql(..., primary=True) or inside
+    a with router.read_your_writes(): block
+    (usage: router = EngineRouter(primary_engine, [replica_engine_1, replica_engine_2]))
+    """
+    def __init__(self, primary: Engine, replicas: List[Engine] = None):
+        """
+        constructor for the class
+        :param primary: sqlalchemy engine of the primary
+        :param replicas: (optional) sqlalchemy engines of the replicas
+        """
+        self.primary = primary
+        self.replicas = list(replicas or list())
+        self._next_replica = 0
+        self._lock = threading.Lock()
+        self._pinned = threading.local()
+
+    def read_engines(self, primary: bool = False) -> List[Engine]:
+        """
+        engines a read is tried on, in order
+        :param primary: read from the primary (read-your-writes)
+        :return: list of sqlalchemy engines, the primary last
+        """
+        if primary or getattr(self._pinned, 'depth', 0) or not self.replicas:
+            return [self.primary]
+        with self._lock:
+            start = self._next_replica
+            self._next_replica = (start + 1) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start] + [self.primary]
+
+    @contextmanager
+    def read_your_writes(self):
+        """
+        context manager sending the reads of the current thread to the primary
+        """
+        self._pinned.depth = getattr(self._pinned, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self._pinned.depth -= 1
+
+    def read_sql(self, sql_text: str, primary: bool = False, **options) -> pd.DataFrame:
+        """
+        db_utils.read_sql on a replica
+        :param sql_text: sql text
+        :param primary: read from the primary (read-your-writes)
+        :param options: (optional) other read_sql arguments and query parameters
+        :return: pandas Dataframe with the results
+        """
+        engines = self.read_engines(primary=primary)
+        for engine in engines[:-1]:
+            try:
+                # checks out (and returns) a pooled connection, so connection failures
+                # are told apart from failures of the query
+                engine.connect().close()
+            except OperationalError as error:
+                LOGGER.warning('replica %r can not be connected to, trying the next engine: '
+                               '%s', engine.url, error)
+                continue
+            try:
+                return db_utils.read_sql(sql_text, engine, **options)
+            except OperationalError as error:
+                if not error.connection_invalidated:
+                    raise
+                LOGGER.warning('replica %r dropped the connection, trying the next engine: '
+                               '%s', engine.url, error)
+        return db_utils.read_sql(sql_text, engines[-1], **options)
+
+    def to_sql(self, data, table_name: str, **options) -> LoadMetrics:
+        """
+        db_utils.to_sql on the primary
+        :param data: pandas dataframe, iterator of dataframes or path of a .csv / .parquet file
+        :param table_name: table name in the database
+        :param options: (optional) other to_sql arguments
+        :return: LoadMetrics of the load
+        """
+        return db_utils.to_sql(data, self.primary, table_name, **options)
+
+    def run_sql(self, sql_text: str, **parameters) -> bool:
+        """
+        db_utils.run_sql on the primary
+        :param sql_text: input sql text
+        :param parameters: (optional) parameters as key-value pairs
+        :return: True/False
+        """
+        return db_utils.run_sql(sql_text, self.primary, **parameters)
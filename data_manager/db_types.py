@@ -0,0 +1,100 @@
+"""
+Decoding policies for PostgreSQL NUMERIC columns.
+NUMERIC values are decoded by a psycopg2 typecaster (or by the COPY parser)
+into float64 or scaled int64 fixed point, instead of decimal.Decimal objects
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import DECIMAL, new_type, register_type
+
+NUMERIC_OID = 1700
+NUMERIC_DTYPES = ('decimal', 'float64', 'int64')
+NUMERIC_SCALE = 4
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+# scaled values of at most this many digits fit int64 without a range check
+INT64_SAFE_DIGITS = 18
+
+
+def register_numeric_caster(dbapi_connection, numeric_dtype: str,
+                            numeric_scale: int = NUMERIC_SCALE):
+    """
+    register the NUMERIC typecaster of a dtype policy on a psycopg2 connection.
+    Call reset_numeric_caster before the connection goes back to the pool
+    :param dbapi_connection: psycopg2 connection
+    :param numeric_dtype: 'decimal', 'float64' or 'int64' (scaled fixed point)
+    :param numeric_scale: number of decimals kept by the int64 policy
+    """
+    if numeric_dtype not in NUMERIC_DTYPES:
+        raise ValueError('numeric_dtype must be one of: {dtypes}'.format(
+            dtypes=', '.join(NUMERIC_DTYPES)))
+
+    if numeric_dtype == 'float64':
+        caster = new_type((NUMERIC_OID,), 'NUMERIC_FLOAT64',
+                          lambda value, cur: None if value is None else float(value))
+    elif numeric_dtype == 'int64':
+        caster = new_type((NUMERIC_OID,), 'NUMERIC_INT64',
+                          lambda value, cur: None if value is None
+                          else numeric_to_fixed(value, numeric_scale))
+    else:
+        caster = DECIMAL
+    register_type(caster, dbapi_connection)
+
+
+def reset_numeric_caster(dbapi_connection):
+    """
+    restore the default decimal.Decimal NUMERIC typecaster on a psycopg2 connection
+    :param dbapi_connection: psycopg2 connection
+    """
+    register_type(DECIMAL, dbapi_connection)
+
+
+def numeric_to_fixed(value: str, numeric_scale: int = NUMERIC_SCALE) -> int:
+    """
+    convert the text of a NUMERIC value to a scaled integer (ex. '12.5' -> 125000),
+    values outside the int64 range once scaled raise
+    :param value: NUMERIC value as text
+    :param numeric_scale: number of decimals kept
+    :return: int
+    """
+    sign = -1 if value.startswith('-') else 1
+    int_part, _, frac_part = value.lstrip('-').partition('.')
+    if len(frac_part) > numeric_scale or not int_part.isdigit():
+        # extra decimals are rounded, NaN raises
+        out_ = int(Decimal(value).scaleb(numeric_scale).quantize(1, rounding=ROUND_HALF_UP))
+    else:
+        out_ = sign * int(int_part + frac_part.ljust(numeric_scale, '0'))
+    if not INT64_MIN <= out_ <= INT64_MAX:
+        raise ValueError('NUMERIC value {value} does not fit int64 with numeric_scale {scale}, '
+                         'use a smaller numeric_scale or numeric_dtype decimal'.format(
+                             value=value, scale=numeric_scale))
+    return out_
+
+
+def numeric_series_to_fixed(values: pd.Series,
+                            numeric_scale: int = NUMERIC_SCALE) -> pd.Series:
+    """
+    vectorized numeric_to_fixed over a series of NUMERIC text values
+    :param values: pandas series of strings (nulls allowed)
+    :param numeric_scale: number of decimals kept
+    :return: pandas series of nullable Int64
+    """
+    text_ = values.astype(object)
+    not_null = text_.notna().to_numpy()
+    valid = text_[not_null].astype(str)
+    out_ = pd.array(np.full(len(values), None, dtype=object), dtype='Int64')
+    if valid.empty:
+        return pd.Series(out_, index=values.index, name=values.name)
+    parts = valid.str.lstrip('-').str.partition('.')
+    if (parts[2].str.len() > numeric_scale).any() or not parts[0].str.isdigit().all() or \
+            (parts[0].str.lstrip('0').str.len() + numeric_scale > INT64_SAFE_DIGITS).any():
+        # rounding, NaN and values which may not fit int64 go through the exact conversion
+        out_[not_null] = [numeric_to_fixed(value, numeric_scale) for value in valid]
+    else:
+        fixed = parts[0].astype(np.int64) * 10 ** numeric_scale
+        if numeric_scale > 0:
+            fixed += parts[2].str.ljust(numeric_scale, '0').astype(np.int64)
+        fixed = np.where(valid.str.startswith('-').to_numpy(), -fixed, fixed)
+        out_[not_null] = fixed
+    return pd.Series(out_, index=values.index, name=values.name)
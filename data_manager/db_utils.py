@@ -2,91 +2,1210 @@
 Database utils
 """
 # pylint: disable=c-extension-no-member, unnecessary-comprehension
-from datetime import datetime
-from typing import List, Any
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime
+from functools import partial
+from itertools import chain
+from typing import List, Any, Callable, Dict, Iterable, Iterator, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm import Session
-from psycopg2.extensions import register_adapter, AsIs
+from psycopg2.extensions import register_adapter, AsIs, encodings
 
+from .db_cache import QueryCache, get_catalog_cache
+from .db_copy import (
+    column_types_from_rows, decode_csv_copy, encode_binary_copy, encode_csv_copy,
+    row_hash_expression, row_hashes
+)
+from .db_load import BulkLoadProfile, ChunkSizeTuner, LoadMetrics
+from .db_types import (
+    NUMERIC_DTYPES, NUMERIC_OID, NUMERIC_SCALE, register_numeric_caster, reset_numeric_caster
+)
 from .exceptions import DatabaseError
 
+LOGGER = logging.getLogger(__name__)
 INSERT_STATEMENT = "INSERT INTO {schema_table} ({columns}) values({table_values})"
+COPY_STATEMENT = "COPY {schema_table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+COPY_BINARY_STATEMENT = "COPY {schema_table} ({columns}) FROM STDIN WITH (FORMAT binary)"
+COPY_TO_STATEMENT = "COPY ({query}) TO STDOUT WITH (FORMAT csv, NULL '\\N')"
+STAGE_TABLE = "data_manager_stage_{table}"
+CREATE_STAGE_STATEMENT = "CREATE TEMP TABLE {stage_table} ON COMMIT DROP AS " \
+                         "SELECT {columns} FROM {schema_table} WITH NO DATA"
+UPSERT_STATEMENT = "INSERT INTO {schema_table} ({columns}) SELECT {columns} FROM {stage_table} " \
+                   "ON CONFLICT ({keys}) {conflict_action}"
+PARALLEL_STAGE_TABLE = "{schema_table}_stage_{suffix}"
+CREATE_PARALLEL_STAGE_STATEMENT = "CREATE UNLOGGED TABLE {stage_table} AS " \
+                                  "SELECT {columns} FROM {schema_table} WITH NO DATA"
+INSERT_SELECT_STATEMENT = "INSERT INTO {schema_table} ({columns}) " \
+                          "SELECT {columns} FROM {stage_table}"
+DROP_TABLE_STATEMENT = "DROP TABLE IF EXISTS {table}"
+CHECKPOINT_TABLE = "public.data_manager_load_checkpoint"
+CREATE_CHECKPOINT_STATEMENT = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        load_id text not null,
+        table_name text not null,
+        chunk_index integer not null,
+        row_start bigint not null,
+        row_end bigint not null,
+        checksum text not null,
+        committed_at timestamptz not null default CURRENT_TIMESTAMP,
+        primary key (load_id, table_name, chunk_index)
+    )
+"""
+CHECKPOINT_QUERY = "SELECT chunk_index, checksum FROM {table} " \
+                   "WHERE load_id = :load_id and table_name = :table_name"
+INSERT_CHECKPOINT_STATEMENT = "INSERT INTO {table} (load_id, table_name, chunk_index, " \
+                              "row_start, row_end, checksum) values (%s, %s, %s, %s, %s, %s)"
+INDEXES_QUERY = """
+    select i.relname as index_name, pg_get_indexdef(i.oid) as index_def
+    from pg_catalog.pg_index x
+        join pg_catalog.pg_class i on i.oid = x.indexrelid
+        join pg_catalog.pg_class t on t.oid = x.indrelid
+        join pg_catalog.pg_namespace n on n.oid = t.relnamespace
+    where
+        n.nspname = :schema_name and t.relname = :table_name and not x.indisprimary and
+        not x.indisunique and
+        not exists (select 1 from pg_catalog.pg_constraint c where c.conindid = x.indexrelid)
+"""
+DROP_INDEX_STATEMENT = "DROP INDEX IF EXISTS {schema_name}.{index_name}"
+SET_CONFIG_STATEMENT = "SELECT set_config(%s, %s, %s)"
+ANALYZE_STATEMENT = "ANALYZE {schema_table}"
+WRITE_MODES = ('copy', 'binary', 'insert')
+FANOUT_ERRORS = ('raise', 'ignore')
+# seconds past the query timeout a fan-out source may take to connect and fetch
+FANOUT_GRACE = 5.0
+PIPELINE_DEPTH = 2
+PUT_TIMEOUT = 0.1
+ATOMICITY_MODES = ('partition', 'all')
+READ_MODES = ('rows', 'copy')
+COLUMN_TYPES_QUERY = """
+    select column_name, udt_name, numeric_scale
+    from information_schema.columns
+    where table_schema = :schema_name and table_name = :table_name
+"""
+TIMEZONE_QUERY = "SELECT current_setting('TimeZone') AS timezone"
+DELTA_KEYS_TABLE = "data_manager_delta_{table}"
+CREATE_DELTA_KEYS_STATEMENT = "CREATE TEMP TABLE {keys_table} ON COMMIT DROP AS " \
+                              "SELECT {keys}, ''::text AS row_hash, 0::bigint AS delta_row " \
+                              "FROM {schema_table} WITH NO DATA"
+DELTA_UNCHANGED_QUERY = "SELECT k.delta_row FROM {keys_table} k JOIN " \
+                        "(SELECT {keys}, {row_hash} AS row_hash FROM {schema_table}) t " \
+                        "ON {join} WHERE t.row_hash = k.row_hash"
+PARTITION_STATEMENT = "SELECT * FROM ({query}) partition_query WHERE {condition}"
+PARTITION_BOUNDS_STATEMENT = "SELECT min({column}) as lower_bound, max({column}) as upper_bound " \
+                             "FROM ({query}) partition_query"
 
 
-def read_sql(sql_text: str, engine: Engine, **parameters):
+def read_sql(sql_text: str, engine: Engine, mode: str = 'rows', numeric_dtype: str = None,
+             numeric_scale: int = NUMERIC_SCALE, cache: QueryCache = None,
+             cache_ttl: float = None, cache_token: Any = None, **parameters):
     """
     read SQL query from a given database engine
     :param sql_text: sql text
     :param engine: sqlalchemy engine
+    :param mode: read path, 'rows' fetches result rows through sqlalchemy,
+        'copy' runs COPY (query) TO STDOUT and parses the stream into typed
+        numpy columns (default is rows)
+    :param numeric_dtype: decoding of NUMERIC columns by the driver, 'decimal',
+        'float64' or 'int64' scaled fixed point (default is decimal for rows
+        and float64 for copy)
+    :param numeric_scale: number of decimals kept by the int64 policy
+        (ex. 12.5 -> 125000 for the default of 4)
+    :param cache: (optional) QueryCache or DiskQueryCache, repeated queries
+        are served from it
+    :param cache_ttl: seconds the cached result is valid for (default is the cache ttl)
+    :param cache_token: (optional) freshness token which is part of the cache key
+        (ex. the date the underlying data was last loaded)
     :param parameters: (optional) parameters as key-value pairs
         (usage: date = test_date)
     :return: pandas Dataframe with the results or throws Database error
     """
+    if mode not in READ_MODES:
+        raise ValueError('mode must be one of: {modes}'.format(modes=', '.join(READ_MODES)))
+    if cache is not None:
+        key = cache.make_key(sql_text, parameters, engine=engine, mode=mode,
+                             numeric_dtype=numeric_dtype, numeric_scale=numeric_scale,
+                             cache_token=cache_token)
+        out_ = cache.get(key)
+        if out_ is None:
+            out_ = read_sql(sql_text, engine, mode=mode, numeric_dtype=numeric_dtype,
+                            numeric_scale=numeric_scale, **parameters)
+            cache.put(key, out_, ttl=cache_ttl)
+        return out_
+    if mode == 'copy':
+        return __read_sql_copy(sql_text=sql_text, engine=engine,
+                               numeric_dtype=numeric_dtype or 'float64',
+                               numeric_scale=numeric_scale, **parameters)
+
     conn = engine.connect()
+    dbapi_connection = conn.connection.connection
     try:
+        if numeric_dtype is not None:
+            register_numeric_caster(dbapi_connection, numeric_dtype, numeric_scale)
         sql_text_params = text(sql_text)
         result = conn.execute(sql_text_params, **parameters)
         columns = [col for col in result.keys()]
-        out_ = pd.DataFrame(result.fetchall(), columns=columns)
+        type_codes = [col[1] for col in result.cursor.description]
+        rows = result.fetchall()
+        out_ = pd.DataFrame(rows, columns=columns)
+        if numeric_dtype == 'int64':
+            # keep scaled integers exact when the column holds nulls
+            for idx, type_code in enumerate(type_codes):
+                if type_code == NUMERIC_OID:
+                    out_[columns[idx]] = pd.array([row[idx] for row in rows], dtype='Int64')
         result.close()
     except DatabaseError:
         raise DatabaseError()
     finally:
+        if numeric_dtype is not None:
+            reset_numeric_caster(dbapi_connection)
         conn.close()
     return out_
 
 
-def to_sql(data: pd.DataFrame, engine: Engine, table_name: str,
-           schema_name: str = None, chunksize: int = 100000):
+def __read_sql_copy(sql_text: str, engine: Engine, numeric_dtype: str = 'float64',
+                    numeric_scale: int = NUMERIC_SCALE, **parameters) -> pd.DataFrame:
+    """
+    read SQL query through COPY (query) TO STDOUT.
+    The query is run once with LIMIT 0 for its column types, then the csv stream
+    is parsed with those types. Timestamps are sent in UTC for the transaction only
+    :param sql_text: sql text
+    :param engine: sqlalchemy engine
+    :param numeric_dtype: decoding of NUMERIC columns, see read_sql
+    :param numeric_scale: number of decimals kept by the int64 policy
+    :param parameters: (optional) parameters as key-value pairs
+    :return: pandas Dataframe with the results or throws Database error
+    """
+    if numeric_dtype not in NUMERIC_DTYPES:
+        raise ValueError('numeric_dtype must be one of: {dtypes}'.format(
+            dtypes=', '.join(NUMERIC_DTYPES)))
+
+    compiled = __compile_statement(sql_text, engine, parameters)
+    conn_ = engine.raw_connection()
+    try:
+        cursor_ = conn_.cursor()
+        query = cursor_.mogrify(str(compiled), compiled.params).decode(encodings[conn_.encoding])
+        query = query.strip().rstrip(';')
+        cursor_.execute("SET LOCAL timezone = 'UTC'")
+        cursor_.execute('SELECT * FROM ({query}) copy_query LIMIT 0'.format(query=query))
+        description = cursor_.description
+        buffer_ = io.BytesIO()
+        cursor_.copy_expert(COPY_TO_STATEMENT.format(query=query), buffer_)
+        buffer_.seek(0)
+        out_ = decode_csv_copy(buffer_, description, numeric_dtype=numeric_dtype,
+                               numeric_scale=numeric_scale)
+        conn_.rollback()
+    except DatabaseError:
+        raise DatabaseError()
+    finally:
+        conn_.close()
+    return out_
+
+
+def __compile_statement(sql_text: str, engine: Engine, parameters: Dict[str, Any]):
+    """
+    compile a sql text with the parameters it uses, text().bindparams raises for
+    parameters which are not in the statement (ex. parameters shared by several queries)
+    :param sql_text: sql text
+    :param engine: sqlalchemy engine
+    :param parameters: parameters as key-value pairs
+    :return: compiled statement
+    """
+    statement = text(sql_text)
+    names = statement.compile(dialect=engine.dialect).params
+    return statement.bindparams(**{name: value for name, value in parameters.items()
+                                   if name in names}).compile(dialect=engine.dialect)
+
+
+def read_sql_stream(sql_text: str, engine: Engine, chunksize: int = 100000,
+                    **parameters) -> Iterator[pd.DataFrame]:
+    """
+    read SQL query from a given database engine in chunks using a
+    server side (named) cursor, so only one chunk is held in memory at a time
+    :param sql_text: sql text
+    :param engine: sqlalchemy engine
+    :param chunksize: number of rows in each yielded dataframe
+    :param parameters: (optional) parameters as key-value pairs
+        (usage: date = test_date)
+    :return: generator of pandas Dataframes with the results or throws Database error
+    """
+    if chunksize is None or chunksize <= 0:
+        raise ValueError('chunksize must be a positive integer')
+
+    conn = engine.connect().execution_options(stream_results=True)
+    try:
+        sql_text_params = text(sql_text)
+        result = conn.execute(sql_text_params, **parameters)
+        columns = [col for col in result.keys()]
+        try:
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=columns)
+        finally:
+            result.close()
+    except DatabaseError:
+        raise DatabaseError()
+    finally:
+        conn.close()
+
+
+def read_sql_partitioned(sql_text: str, engine: Engine, partition_column: str,
+                         partitions: int = None, bounds: List[Any] = None,
+                         max_workers: int = None, mode: str = 'rows',
+                         **parameters) -> pd.DataFrame:
+    """
+    read SQL query by splitting it on a partition column and running the sub-queries
+    at the same time on a thread pool, each on its own pooled connection.
+    Every row of the query is read once: the first partition also holds the rows
+    below the first split point and the nulls, the last one the rows above the last
+    :param sql_text: sql text
+    :param engine: sqlalchemy engine, the pool should allow max_workers connections
+    :param partition_column: column of the query to split on (ex. price_date, symbol_id)
+    :param partitions: number of partitions, split points are spread evenly
+        between the min and max of the partition column
+    :param bounds: explicit sorted split points, n split points make n + 1 partitions
+        (used instead of partitions)
+    :param max_workers: number of threads (default is the number of partitions)
+    :param mode: read path for each partition, see read_sql
+    :param parameters: (optional) parameters as key-value pairs
+        (usage: date = test_date)
+    :return: pandas Dataframe with the partitions joined in partition order
+    """
+    if bounds is None:
+        if partitions is None or partitions <= 0:
+            raise ValueError('either a positive partitions count or bounds is needed')
+        db_bounds = read_sql(
+            sql_text=PARTITION_BOUNDS_STATEMENT.format(column=partition_column,
+                                                       query=sql_text),
+            engine=engine, **parameters
+        )
+        bounds = __partition_split_points(lower=db_bounds.iloc[0, 0],
+                                          upper=db_bounds.iloc[0, 1],
+                                          partitions=partitions)
+    else:
+        bounds = list(bounds)
+
+    conditions = list()
+    for idx in range(len(bounds) + 1):
+        condition = list()
+        if idx > 0:
+            condition.append('{column} >= :_partition_lower'.format(column=partition_column))
+        if idx < len(bounds):
+            condition.append('{column} < :_partition_upper'.format(column=partition_column))
+        if idx == 0:
+            condition = ['({conditions} or {column} is null)'.format(
+                conditions=' and '.join(condition) or 'true', column=partition_column)]
+        bound_parameters = dict(parameters)
+        if idx > 0:
+            bound_parameters['_partition_lower'] = bounds[idx - 1]
+        if idx < len(bounds):
+            bound_parameters['_partition_upper'] = bounds[idx]
+        conditions.append((' and '.join(condition), bound_parameters))
+
+    def _read_partition(partition):
+        condition, bound_parameters = partition
+        return read_sql(PARTITION_STATEMENT.format(query=sql_text, condition=condition),
+                        engine, mode=mode, **bound_parameters)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(conditions)) as executor:
+        frames = list(executor.map(_read_partition, conditions))
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_sql_fanout(queries: Dict[Any, Any], timeout: float = None,
+                    timeouts: Dict[Any, float] = None, source_column: str = 'source',
+                    errors: str = 'raise', max_workers: int = None,
+                    **parameters) -> pd.DataFrame:
+    """
+    run queries against several databases at the same time and combine the results.
+    A timeout is a statement_timeout set for the query's transaction, the server cancels
+    the query so a slow database gives up its connection instead of holding up the rest.
+    A source with a timeout which has no result FANOUT_GRACE seconds past it (ex. a slow
+    connect or a full connection pool) is not waited for and fails like a timed out query
+    :param queries: engine -> sql text (tagged with the database name of the engine),
+        or source name -> (engine, sql text)
+        (usage: {research_engine: sql_text, process_engine: sql_text})
+    :param timeout: (optional) seconds each query may run
+    :param timeouts: (optional) engine or source name -> seconds, overrides timeout
+    :param source_column: column of the result holding the source of each row
+    :param errors: 'raise' raises when a query fails or times out after all queries
+        ended, 'ignore' logs it and combines the other results (default is raise)
+    :param max_workers: number of threads (default is the number of queries)
+    :param parameters: (optional) parameters of every query as key-value pairs
+        (usage: date = test_date)
+    :return: pandas Dataframe with the results in the order of queries
+    """
+    if errors not in FANOUT_ERRORS:
+        raise ValueError('errors must be one of: {modes}'.format(modes=', '.join(FANOUT_ERRORS)))
+    if not queries:
+        return pd.DataFrame(columns=[source_column])
+
+    sources = list()
+    for key, query in queries.items():
+        if isinstance(key, Engine):
+            sources.append((key.url.database, key, query, key))
+        else:
+            engine, sql_text = query
+            sources.append((key, engine, sql_text, key))
+
+    def _read_source(source: Tuple[Any, Engine, str, Any]) -> pd.DataFrame:
+        name, engine, sql_text, key = source
+        query_timeout = (timeouts or dict()).get(key, timeout)
+        out_ = __read_sql_timeout(sql_text, engine, timeout=query_timeout, **parameters)
+        if source_column in out_.columns:
+            raise ValueError('query result of {name} already has a {column} column, pass '
+                             'another source_column'.format(name=name, column=source_column))
+        out_.insert(0, source_column, name)
+        return out_
+
+    frames = list()
+    failures = list()
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sources))
+    try:
+        futures = [executor.submit(_read_source, source) for source in sources]
+        for source, future in zip(sources, futures):
+            query_timeout = (timeouts or dict()).get(source[3], timeout)
+            wait = None
+            if query_timeout is not None:
+                wait = max(0.0, start + query_timeout + FANOUT_GRACE - time.monotonic())
+            try:
+                frames.append(future.result(timeout=wait))
+            except Exception as error:  # pylint: disable=broad-except
+                if isinstance(error, FutureTimeoutError):
+                    future.cancel()
+                    error = TimeoutError('no result within {seconds} seconds'.format(
+                        seconds=query_timeout + FANOUT_GRACE))
+                LOGGER.warning('fan-out query on %s failed: %s', source[0], error)
+                failures.append((source[0], error))
+    finally:
+        # a source past its deadline keeps its thread until the driver returns
+        executor.shutdown(wait=False)
+
+    if failures and errors == 'raise':
+        _, error = failures[0]
+        raise Exception('fan-out query failed on {failed}: {error}'.format(
+            failed=', '.join(str(failed) for failed, _ in failures), error=error)) from error
+    if not frames:
+        return pd.DataFrame(columns=[source_column])
+    return pd.concat(frames, ignore_index=True)
+
+
+def __read_sql_timeout(sql_text: str, engine: Engine, timeout: float = None,
+                       **parameters) -> pd.DataFrame:
+    """
+    read SQL query with a statement_timeout for its transaction
+    :param sql_text: sql text
+    :param engine: sqlalchemy engine
+    :param timeout: (optional) seconds the query may run
+    :param parameters: (optional) parameters as key-value pairs
+    :return: pandas Dataframe with the results or throws Database error
+    """
+    if timeout is None:
+        return read_sql(sql_text, engine, **parameters)
+
+    compiled = __compile_statement(sql_text, engine, parameters)
+    conn_ = engine.raw_connection()
+    try:
+        cursor_ = conn_.cursor()
+        cursor_.execute(SET_CONFIG_STATEMENT,
+                        ('statement_timeout', str(max(1, int(timeout * 1000))), True))
+        cursor_.execute(str(compiled), compiled.params)
+        columns = [col[0] for col in cursor_.description]
+        out_ = pd.DataFrame(cursor_.fetchall(), columns=columns)
+        conn_.rollback()
+    except DatabaseError:
+        raise DatabaseError()
+    finally:
+        conn_.close()
+    return out_
+
+
+def __partition_split_points(lower: Any, upper: Any, partitions: int) -> List[Any]:
+    """
+    evenly spaced split points between the bounds of a partition column
+    :param lower: minimum value of the partition column
+    :param upper: maximum value of the partition column
+    :param partitions: number of partitions
+    :return: list of partitions - 1 split points (fewer for narrow integer ranges)
+    """
+    if lower is None or upper is None or pd.isna(lower) or pd.isna(upper) or partitions == 1:
+        return list()
+
+    if isinstance(lower, (date, datetime, pd.Timestamp, np.datetime64)):
+        points = pd.date_range(pd.Timestamp(lower), pd.Timestamp(upper),
+                               periods=partitions + 1)[1:-1]
+        if isinstance(lower, date) and not isinstance(lower, datetime):
+            return sorted({point.date() for point in points})
+        return [point.to_pydatetime() for point in points]
+
+    points = np.linspace(float(lower), float(upper), partitions + 1)[1:-1]
+    if isinstance(lower, (int, np.integer)):
+        return sorted({int(point) for point in np.ceil(points)})
+    return [type(lower)(point) for point in points]
+
+
+def to_sql(data: Union[pd.DataFrame, Iterable[pd.DataFrame], str], engine: Engine,
+           table_name: str, schema_name: str = None,
+           chunksize: Union[int, str, ChunkSizeTuner] = 100000,
+           mode: str = 'copy', upsert_keys: List[str] = None, parallel: int = None,
+           atomicity: str = 'partition', load_id: str = None,
+           metrics_callback: Callable[[LoadMetrics], Any] = None,
+           bulk_load: Union[bool, BulkLoadProfile] = False,
+           pipeline: bool = False, delta_keys: List[str] = None) -> LoadMetrics:
     """
     commit pandas dataframe to a table by appending the data
-    :param data: pandas dataframe with data.
+    :param data: pandas dataframe with data, an iterator of dataframes or the path
+        of a .csv or .parquet file. Iterators and files are streamed chunk by chunk
+        inside one transaction, so only one chunk is held in memory.
         The columns of the table should be same name as table columns
     :param engine: sqlalchemy engine
     :param table_name: tale name in the database
-    :param chunksize: chunks commiting data to the table
+    :param chunksize: chunks commiting data to the table, 'auto' adapts the chunk size
+        to a target batch size and latency from the measured throughput
+        (pass a db_load.ChunkSizeTuner for other targets)
     :param schema_name: schema name in which the table is location
         (default is None)
+    :param mode: write path used for each chunk, 'copy' streams the chunk
+        through COPY ... FROM STDIN, 'binary' streams it in the binary COPY format
+        encoded column-wise from numpy arrays, 'insert' uses executemany
+        INSERT statements (default is copy)
+    :param upsert_keys: (optional) columns of a unique key or primary key of the table.
+        The data is written to a temporary staging table and merged into the table
+        with one INSERT ... ON CONFLICT (upsert_keys) DO UPDATE, the keys should be
+        unique within the data
+    :param parallel: (optional) number of pooled connections loading partitions
+        of the data at the same time from a thread pool
+    :param atomicity: commit behaviour of a parallel load, 'partition' commits each
+        connection's partition on its own, 'all' loads an unlogged staging table
+        and merges it into the table in one final transaction (default is partition)
+    :param load_id: (optional) id of a resumable load. Every chunk is committed on its
+        own together with a row in the checkpoint table (load id, chunk index,
+        row range, checksum), a rerun with the same load id skips the committed chunks.
+        Needs a fixed chunksize and no parallel workers
+    :param metrics_callback: (optional) function called with the LoadMetrics of the load,
+        the metrics are also logged at INFO level by the data_manager.db_utils logger
+    :param bulk_load: (optional) True or a db_load.BulkLoadProfile. Drops the non primary
+        key indexes of the table, loads with tuned session settings (synchronous_commit
+        off), rebuilds the indexes concurrently with a larger maintenance_work_mem and
+        runs ANALYZE. Indexes are rebuilt even when the load fails
+    :param pipeline: encode the next chunks in a background thread while the current
+        chunk is sent, at most PIPELINE_DEPTH encoded chunks wait for the connection
+        (not used by checkpointed loads)
+    :param delta_keys: (optional) columns of the business key, a unique key of the table.
+        Each chunk is hashed row by row and compared with the hashes of the table rows
+        computed server side for the chunk's range of the first key column, only new or
+        changed rows are written (upserted on delta_keys). Not used with load_id
+    :return: LoadMetrics with rows, bytes, chunk count, chunk latency percentiles,
+        encode and server time and rows/sec
     """
-    def _chunks(input_list: List[Any] or pd.DataFrame, chunk: int):
-        """
-        yield successive chunks from 1
-        :param input_list:
-        :param chunk:
-        :return:
-        """
-        for iter_ in range(0, len(input_list), chunk):
-            yield input_list[iter_: iter_ + chunk]
-
-    start = datetime.now()
+    if mode not in WRITE_MODES:
+        raise ValueError('mode must be one of: {modes}'.format(modes=', '.join(WRITE_MODES)))
+    if load_id is not None and (not isinstance(chunksize, int) or
+                                (parallel is not None and parallel > 1)):
+        raise ValueError('checkpointed loads need a fixed integer chunksize and no parallel')
+    if load_id is not None and delta_keys:
+        raise ValueError('checkpointed loads can not be delta loads')
+
+    start = time.perf_counter()
     table_ = __get_db_object(
         object_name=table_name, schema_name=schema_name,
         engine=engine, is_table=True
     )
+    metrics = LoadMetrics(table_name=table_)
+    if chunksize == 'auto':
+        chunksize = ChunkSizeTuner()
+    tuner = chunksize if isinstance(chunksize, ChunkSizeTuner) else None
+    chunks = __chunks(data, chunksize)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return __finish_load(metrics, start, metrics_callback)
+    chunks = chain([first_chunk], chunks)
+    columns = first_chunk.columns.tolist()
+    if delta_keys:
+        chunks = __delta_chunks(chunks=chunks, engine=engine, table_=table_, columns=columns,
+                                delta_keys=delta_keys, metrics=metrics)
+        upsert_keys = upsert_keys or delta_keys
+    profile = BulkLoadProfile() if bulk_load is True else bulk_load or None
+    settings = profile.session_settings if profile is not None else None
+    indexes = list()
+    if profile is not None and profile.drop_indexes:
+        indexes = __drop_indexes(engine, table_)
+    try:
+        if load_id is not None:
+            __to_sql_checkpointed(chunks=chunks, engine=engine, table_=table_, columns=columns,
+                                  mode=mode, upsert_keys=upsert_keys, load_id=load_id,
+                                  metrics=metrics, session_settings=settings)
+        elif parallel is not None and parallel > 1:
+            __to_sql_parallel(chunks=chunks, engine=engine, table_=table_, columns=columns,
+                              mode=mode, upsert_keys=upsert_keys, parallel=parallel,
+                              atomicity=atomicity, tuner=tuner, metrics=metrics,
+                              session_settings=settings, pipeline=pipeline)
+        else:
+            write_statement, encode_chunk, send_chunk = __chunk_writer(
+                mode=mode, columns=columns, table_=table_, engine=engine,
+                target_table=__stage_table(table_) if upsert_keys else table_
+            )
+            conn_ = engine.raw_connection()
+            try:
+                cursor_ = conn_.cursor()
+                __write_chunks(cursor_=cursor_, chunks=chunks, write_statement=write_statement,
+                               encode_chunk=encode_chunk, send_chunk=send_chunk,
+                               columns=columns, table_=table_, upsert_keys=upsert_keys,
+                               tuner=tuner, metrics=metrics, session_settings=settings,
+                               pipeline=pipeline)
+                conn_.commit()
+            except DatabaseError:
+                raise DatabaseError()
+            finally:
+                conn_.close()
+    finally:
+        if profile is not None:
+            __finish_bulk_load(engine, table_, indexes, profile)
+    return __finish_load(metrics, start, metrics_callback)
+
+
+def __finish_load(metrics: LoadMetrics, start: float,
+                  metrics_callback: Callable[[LoadMetrics], Any] = None) -> LoadMetrics:
+    """
+    record the duration of a load, log it and hand the metrics to the callback
+    :param metrics: LoadMetrics of the load
+    :param start: time.perf_counter() at the start of the load
+    :param metrics_callback: (optional) function called with the LoadMetrics of the load
+    :return: LoadMetrics of the load
+    """
+    metrics.total_seconds = time.perf_counter() - start
+    LOGGER.info('committed %s rows to %s in %.3f seconds (%.0f rows/sec)',
+                metrics.rows_written, metrics.table_name, metrics.total_seconds,
+                metrics.rows_per_second)
+    if metrics_callback is not None:
+        metrics_callback(metrics)
+    return metrics
+
+
+def __write_chunks(cursor_, chunks: Iterable[pd.DataFrame], write_statement: str,
+                   encode_chunk, send_chunk, columns: List[str], table_: str,
+                   upsert_keys: List[str] = None, tuner: ChunkSizeTuner = None,
+                   metrics: LoadMetrics = None, session_settings: dict = None,
+                   pipeline: bool = False):
+    """
+    write chunks on a connection without committing, through a temporary staging
+    table merged into the table when upsert keys are given
+    :param cursor_: psycopg2 cursor
+    :param chunks: iterable of pandas dataframes
+    :param write_statement: write statement of __chunk_writer
+    :param encode_chunk: chunk encoder of __chunk_writer
+    :param send_chunk: chunk sender of __chunk_writer
+    :param columns: columns of the data
+    :param table_: full table name
+    :param upsert_keys: (optional) conflict key of the upsert
+    :param tuner: (optional) ChunkSizeTuner told about every written chunk
+    :param metrics: (optional) LoadMetrics recording every written chunk
+    :param session_settings: (optional) setting name -> value set for the transaction
+    :param pipeline: encode the chunks in a background thread ahead of sending them
+    """
+    for name, value in (session_settings or dict()).items():
+        cursor_.execute(SET_CONFIG_STATEMENT, (name, str(value), True))
+    if upsert_keys:
+        cursor_.execute(CREATE_STAGE_STATEMENT.format(
+            stage_table=__stage_table(table_), columns=', '.join(columns), schema_table=table_
+        ))
+    encoded = __encoded_chunks(chunks=chunks, encode_chunk=encode_chunk, columns=columns,
+                               depth=PIPELINE_DEPTH if pipeline else 0)
+    for rows_chunk, payload, nbytes, encode_seconds in encoded:
+        start = time.perf_counter()
+        send_chunk(cursor_, write_statement, payload)
+        seconds = time.perf_counter() - start + encode_seconds
+        if tuner is not None:
+            tuner.observe(rows=len(rows_chunk), nbytes=nbytes, seconds=seconds)
+        if metrics is not None:
+            metrics.record_chunk(rows=len(rows_chunk), nbytes=nbytes, seconds=seconds,
+                                 encode_seconds=encode_seconds)
+    if upsert_keys:
+        cursor_.execute(__upsert_statement(
+            schema_table=table_, stage_table=__stage_table(table_),
+            columns=columns, upsert_keys=upsert_keys
+        ))
+
+
+def __encoded_chunks(chunks: Iterable[pd.DataFrame], encode_chunk, columns: List[str],
+                     depth: int = 0) -> Iterator[tuple]:
+    """
+    encode chunks in order, with a depth the chunks are encoded in a background thread
+    which waits once depth encoded chunks are not taken yet
+    :param chunks: iterable of pandas dataframes
+    :param encode_chunk: chunk encoder of __chunk_writer
+    :param columns: columns of the data
+    :param depth: number of encoded chunks buffered ahead, 0 encodes on the caller thread
+    :return: generator of (rows_chunk, payload, bytes, seconds encoding)
+    """
+    def _encode(rows_chunk: pd.DataFrame) -> tuple:
+        start = time.perf_counter()
+        payload, nbytes = encode_chunk(rows_chunk[columns])
+        return rows_chunk, payload, nbytes, time.perf_counter() - start
+
+    if depth <= 0:
+        for rows_chunk in chunks:
+            yield _encode(rows_chunk)
+        return
+
+    encoded = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def _encoder():
+        try:
+            for rows_chunk in chunks:
+                if stopped.is_set():
+                    return
+                encoded.put(_encode(rows_chunk))
+        except Exception as error:  # pylint: disable=broad-except
+            encoded.put(error)
+            return
+        encoded.put(None)
+
+    encoder = threading.Thread(target=_encoder, daemon=True)
+    encoder.start()
+    try:
+        while True:
+            item = encoded.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # a failed send stops the encoder, the queue is drained so it is not left waiting
+        stopped.set()
+        while encoder.is_alive():
+            try:
+                encoded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def __to_sql_parallel(chunks: Iterable[pd.DataFrame], engine: Engine, table_: str,
+                      columns: List[str], mode: str, upsert_keys: List[str],
+                      parallel: int, atomicity: str, tuner: ChunkSizeTuner = None,
+                      metrics: LoadMetrics = None, session_settings: dict = None,
+                      pipeline: bool = False):
+    """
+    write chunks over parallel pooled connections. Worker threads take chunks from
+    a bounded queue, so each worker loads one partition of the data in its own transaction.
+    With atomicity 'partition' each worker commits its partition, with 'all' the workers
+    load an unlogged staging table which is merged into the table in one final transaction
+    :param chunks: iterable of pandas dataframes
+    :param engine: sqlalchemy engine, the pool should allow parallel connections
+    :param table_: full table name
+    :param columns: columns of the data
+    :param mode: write mode (copy, binary or insert)
+    :param upsert_keys: (optional) conflict key of the upsert
+    :param parallel: number of connections
+    :param atomicity: 'partition' or 'all'
+    :param tuner: (optional) ChunkSizeTuner told about every written chunk
+    :param metrics: (optional) LoadMetrics recording every written chunk
+    :param session_settings: (optional) setting name -> value set for each transaction
+    :param pipeline: encode the chunks of each worker ahead of sending them
+    """
+    if atomicity not in ATOMICITY_MODES:
+        raise ValueError('atomicity must be one of: {modes}'.format(
+            modes=', '.join(ATOMICITY_MODES)))
+
+    if atomicity == 'all':
+        target_table = PARALLEL_STAGE_TABLE.format(schema_table=table_,
+                                                   suffix=uuid.uuid4().hex[:8])
+        run_statements(engine, [CREATE_PARALLEL_STAGE_STATEMENT.format(
+            stage_table=target_table, columns=', '.join(columns), schema_table=table_
+        )])
+        worker_upsert_keys = None
+    else:
+        target_table = __stage_table(table_) if upsert_keys else table_
+        worker_upsert_keys = upsert_keys
+    write_statement, encode_chunk, send_chunk = __chunk_writer(
+        mode=mode, target_table=target_table, columns=columns, table_=table_, engine=engine
+    )
+
+    work_queue = queue.Queue(maxsize=2 * parallel)
+    errors = list()
+
+    def _worker(partition: int):
+        done = [False]
+
+        def _queued_chunks():
+            while True:
+                rows_chunk = work_queue.get()
+                if rows_chunk is None:
+                    done[0] = True
+                    return
+                if not errors:
+                    yield rows_chunk
+
+        conn_ = None
+        try:
+            conn_ = engine.raw_connection()
+            __write_chunks(cursor_=conn_.cursor(), chunks=_queued_chunks(),
+                           write_statement=write_statement, encode_chunk=encode_chunk,
+                           send_chunk=send_chunk, columns=columns, table_=table_,
+                           upsert_keys=worker_upsert_keys, tuner=tuner, metrics=metrics,
+                           session_settings=session_settings, pipeline=pipeline)
+            if errors:
+                conn_.rollback()
+            else:
+                conn_.commit()
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append((partition, error))
+            while not done[0]:
+                done[0] = work_queue.get() is None
+        finally:
+            if conn_ is not None:
+                conn_.close()
+
+    def _put(item) -> bool:
+        # a full queue is waited on only while a worker is left to take from it
+        while True:
+            try:
+                work_queue.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                if all(future.done() for future in futures):
+                    return False
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(_worker, partition) for partition in range(parallel)]
+        try:
+            for rows_chunk in chunks:
+                if errors or not _put(rows_chunk):
+                    break
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(('input', error))
+        finally:
+            for _ in range(parallel):
+                if not _put(None):
+                    break
+    for partition, future in enumerate(futures):
+        if future.exception() is not None:
+            errors.append((partition, future.exception()))
+    if not errors and not work_queue.empty():
+        errors.append(('input', Exception('workers stopped before the end of the data')))
+
+    if atomicity == 'all':
+        if errors:
+            run_statements(engine, [DROP_TABLE_STATEMENT.format(table=target_table)])
+        else:
+            if upsert_keys:
+                merge_statement = __upsert_statement(
+                    schema_table=table_, stage_table=target_table,
+                    columns=columns, upsert_keys=upsert_keys
+                )
+            else:
+                merge_statement = INSERT_SELECT_STATEMENT.format(
+                    schema_table=table_, columns=', '.join(columns), stage_table=target_table
+                )
+            try:
+                run_statements(engine, [merge_statement,
+                                        DROP_TABLE_STATEMENT.format(table=target_table)])
+            except Exception:
+                run_statements(engine, [DROP_TABLE_STATEMENT.format(table=target_table)])
+                raise
+
+    if errors:
+        partition, error = errors[0]
+        raise Exception('parallel load failed in partition {partition}, {atomicity} '
+                        'committed: {error}'.format(
+                            partition=partition, error=error,
+                            atomicity='other partitions may be' if atomicity == 'partition'
+                            else 'nothing')) from error
+
+
+def __to_sql_checkpointed(chunks: Iterable[pd.DataFrame], engine: Engine, table_: str,
+                          columns: List[str], mode: str, upsert_keys: List[str],
+                          load_id: str, metrics: LoadMetrics = None,
+                          session_settings: dict = None):
+    """
+    write chunks committing each one with its checkpoint row, chunks already
+    committed under the load id are skipped after their checksum is compared
+    :param chunks: iterable of pandas dataframes
+    :param engine: sqlalchemy engine
+    :param table_: full table name
+    :param columns: columns of the data
+    :param mode: write mode (copy, binary or insert)
+    :param upsert_keys: (optional) conflict key of the upsert
+    :param load_id: id of the load
+    :param metrics: (optional) LoadMetrics recording every written chunk
+    :param session_settings: (optional) setting name -> value set for each transaction
+    """
+    run_statements(engine, [CREATE_CHECKPOINT_STATEMENT.format(table=CHECKPOINT_TABLE)])
+    db_checkpoints = read_sql(
+        CHECKPOINT_QUERY.format(table=CHECKPOINT_TABLE), engine,
+        load_id=load_id, table_name=table_
+    )
+    committed = dict(zip(db_checkpoints['chunk_index'], db_checkpoints['checksum']))
+
+    write_statement, encode_chunk, send_chunk = __chunk_writer(
+        mode=mode, columns=columns, table_=table_, engine=engine,
+        target_table=__stage_table(table_) if upsert_keys else table_
+    )
+    row_start = 0
+    skipped = 0
     conn_ = engine.raw_connection()
     try:
         cursor_ = conn_.cursor()
-        write_statement = INSERT_STATEMENT.format(
-            schema_table=table_,
-            columns=', '.join(data.columns.tolist()),
-            table_values=', '.join(['%s' for _ in data.columns.tolist()])
-        )
-        register_adapter(np.int64, AsIs)
-        for _, rows_chunk in enumerate(_chunks(data, chunksize)):
-            chunks = rows_chunk.to_records(index=False)
-            cursor_.executemany(write_statement, chunks)
+        for chunk_index, rows_chunk in enumerate(chunks):
+            rows_chunk = rows_chunk[columns]
+            row_end = row_start + len(rows_chunk)
+            checksum = hashlib.sha256(
+                pd.util.hash_pandas_object(rows_chunk, index=False).values.tobytes()
+            ).hexdigest()
+            if chunk_index in committed:
+                if committed[chunk_index] != checksum:
+                    raise ValueError('chunk {chunk} of load {load_id} does not match the '
+                                     'committed checksum, the data or chunksize '
+                                     'changed'.format(chunk=chunk_index, load_id=load_id))
+                skipped += 1
+            else:
+                __write_chunks(cursor_=cursor_, chunks=[rows_chunk],
+                               write_statement=write_statement, encode_chunk=encode_chunk,
+                               send_chunk=send_chunk, columns=columns, table_=table_,
+                               upsert_keys=upsert_keys, metrics=metrics,
+                               session_settings=session_settings)
+                cursor_.execute(INSERT_CHECKPOINT_STATEMENT.format(table=CHECKPOINT_TABLE),
+                                (load_id, table_, chunk_index, row_start, row_end, checksum))
+                conn_.commit()
+            row_start = row_end
+    except DatabaseError:
+        raise DatabaseError()
+    finally:
+        conn_.close()
+    if skipped:
+        LOGGER.info('skipped %s committed chunks of load %s', skipped, load_id)
+
+
+def run_statements(engine: Engine, statements: List[str]):
+    """
+    run sql statements in one transaction on a raw connection
+    :param engine: sqlalchemy engine
+    :param statements: list of sql texts without parameters
+    """
+    conn_ = engine.raw_connection()
+    try:
+        cursor_ = conn_.cursor()
+        for statement in statements:
+            cursor_.execute(statement)
         conn_.commit()
+    finally:
+        conn_.close()
+
+
+def __delta_chunks(chunks: Iterable[pd.DataFrame], engine: Engine, table_: str,
+                   columns: List[str], delta_keys: List[str],
+                   metrics: LoadMetrics = None) -> Iterator[pd.DataFrame]:
+    """
+    drop the rows of each chunk which are already in the table unchanged. The keys and
+    row hashes of the chunk are copied to a temporary table joined with the table on
+    every key column, so only the table rows of the chunk's keys are hashed server side
+    :param chunks: iterable of pandas dataframes
+    :param engine: sqlalchemy engine
+    :param table_: full table name
+    :param columns: columns of the data
+    :param delta_keys: columns of the business key
+    :param metrics: (optional) LoadMetrics counting the skipped rows
+    :return: generator of pandas dataframes holding the new or changed rows
+    """
+    missing = [key for key in delta_keys if key not in columns]
+    if missing:
+        raise ValueError('delta keys not in data: {keys}'.format(keys=', '.join(missing)))
+
+    column_types = __get_column_types(table_, engine)
+    timezone = __get_session_timezone(engine)
+    keys_table = DELTA_KEYS_TABLE.format(table=table_.split('.', 1)[1])
+    create_statement = CREATE_DELTA_KEYS_STATEMENT.format(
+        keys_table=keys_table, keys=', '.join(delta_keys), schema_table=table_)
+    copy_statement = COPY_STATEMENT.format(
+        schema_table=keys_table, columns=', '.join(delta_keys + ['row_hash', 'delta_row']))
+    unchanged_query = DELTA_UNCHANGED_QUERY.format(
+        keys_table=keys_table, keys=', '.join(delta_keys), schema_table=table_,
+        row_hash=row_hash_expression(columns, column_types),
+        join=' AND '.join('t.{key} = k.{key}'.format(key=key) for key in delta_keys)
+    )
+    skipped = 0
+    conn_ = engine.raw_connection()
+    try:
+        cursor_ = conn_.cursor()
+        for rows_chunk in chunks:
+            if rows_chunk.empty:
+                continue
+            rows_chunk = rows_chunk[columns]
+            keys_chunk = rows_chunk[delta_keys].assign(
+                row_hash=row_hashes(rows_chunk, column_types, timezone),
+                delta_row=np.arange(len(rows_chunk)))
+            cursor_.execute(create_statement)
+            cursor_.copy_expert(copy_statement,
+                                io.BytesIO(encode_csv_copy(keys_chunk).encode('utf-8')))
+            cursor_.execute(unchanged_query)
+            unchanged_rows = [row[0] for row in cursor_.fetchall()]
+            conn_.rollback()
+            changed = ~np.isin(np.arange(len(rows_chunk)), unchanged_rows)
+            unchanged = len(rows_chunk) - int(changed.sum())
+            skipped += unchanged
+            if metrics is not None:
+                metrics.rows_skipped += unchanged
+            if changed.any():
+                yield rows_chunk[changed]
     except DatabaseError:
         raise DatabaseError()
     finally:
         conn_.close()
+    LOGGER.info('delta load of %s skipped %s unchanged rows', table_, skipped)
+
+
+def __drop_indexes(engine: Engine, table_: str) -> List[tuple]:
+    """
+    drop the indexes of a table which are neither unique nor back a constraint,
+    the definition of every index is logged before it is dropped
+    :param engine: sqlalchemy engine
+    :param table_: full table name
+    :return: list of (index name, index definition) dropped
+    """
+    db_schema, db_table = table_.split('.', 1)
+    db_indexes = read_sql(INDEXES_QUERY, engine, schema_name=db_schema, table_name=db_table)
+    indexes = list(db_indexes.itertuples(index=False, name=None))
+    for index_name, index_def in indexes:
+        LOGGER.info('dropping index %s for the load of %s: %s', index_name, table_, index_def)
+    if indexes:
+        run_statements(engine, [DROP_INDEX_STATEMENT.format(schema_name=db_schema,
+                                                            index_name=index_name)
+                                for index_name, _ in indexes])
+        LOGGER.info('dropped %s indexes of %s for the load: %s', len(indexes), table_,
+                    ', '.join(index_name for index_name, _ in indexes))
+    return indexes
+
+
+def __finish_bulk_load(engine: Engine, table_: str, indexes: List[tuple],
+                       profile: BulkLoadProfile):
+    """
+    rebuild the dropped indexes of a table and analyze it, on an autocommit
+    connection as CREATE INDEX CONCURRENTLY can not run in a transaction.
+    A failed index does not stop the others, the failures are raised at the end
+    :param engine: sqlalchemy engine
+    :param table_: full table name
+    :param indexes: list of (index name, index definition) of __drop_indexes
+    :param profile: BulkLoadProfile of the load
+    """
+    failures = list()
+    conn_ = engine.raw_connection()
+    try:
+        conn_.rollback()
+        conn_.connection.autocommit = True
+        cursor_ = conn_.cursor()
+        try:
+            if profile.maintenance_work_mem:
+                cursor_.execute(SET_CONFIG_STATEMENT,
+                                ('maintenance_work_mem', profile.maintenance_work_mem, False))
+            for index_name, index_def in indexes:
+                if profile.rebuild_concurrently:
+                    index_def = index_def.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+                start = time.perf_counter()
+                try:
+                    cursor_.execute(index_def)
+                except Exception as error:  # pylint: disable=broad-except
+                    LOGGER.error('rebuilding index %s failed: %s (definition: %s)',
+                                 index_name, str(error).strip(), index_def)
+                    failures.append((index_name, index_def, error))
+                    continue
+                LOGGER.info('rebuilt index %s in %.3f seconds', index_name,
+                            time.perf_counter() - start)
+            if profile.analyze:
+                cursor_.execute(ANALYZE_STATEMENT.format(schema_table=table_))
+        finally:
+            cursor_.execute('RESET maintenance_work_mem')
+    finally:
+        conn_.connection.autocommit = False
+        conn_.close()
+
+    if failures:
+        raise Exception('rebuilding {count} indexes of {table} failed: {failed}'.format(
+            count=len(failures), table=table_,
+            failed='; '.join('{name} ({error}): {definition}'.format(
+                name=name, error=str(error).strip(), definition=definition)
+                for name, definition, error in failures))) from failures[0][2]
+
+
+def __stage_table(table_: str) -> str:
+    """
+    name of the temporary staging table of a table
+    :param table_: full table name
+    :return: staging table name
+    """
+    return STAGE_TABLE.format(table=table_.split('.', 1)[1])
+
+
+def __chunks(data: Union[pd.DataFrame, Iterable[pd.DataFrame], str],
+             chunksize: Union[int, ChunkSizeTuner]) -> Iterator[pd.DataFrame]:
+    """
+    yield successive chunks of at most chunksize rows
+    :param data: pandas dataframe, iterator of dataframes or path of a .csv / .parquet file
+    :param chunksize: number of rows in a chunk, or a ChunkSizeTuner which is asked
+        for the size of every chunk (files are read in chunks of its max_chunksize)
+    :return: generator of pandas dataframes
+    """
+    tuner = chunksize if isinstance(chunksize, ChunkSizeTuner) else None
+    if tuner is not None:
+        chunksize = tuner.max_chunksize
+
+    if isinstance(data, pd.DataFrame):
+        frames = [data]
+    elif isinstance(data, (str, os.PathLike)):
+        path = os.fspath(data)
+        if path.lower().endswith('.csv'):
+            frames = pd.read_csv(path, chunksize=chunksize)
+        elif path.lower().endswith('.parquet'):
+            try:
+                from pyarrow import parquet  # pylint: disable=import-outside-toplevel
+            except ImportError as error:
+                raise ImportError('reading parquet files needs pyarrow, '
+                                  'run: pip install data_manager[cache]') from error
+            frames = (batch.to_pandas() for batch in
+                      parquet.ParquetFile(path).iter_batches(batch_size=chunksize))
+        else:
+            raise ValueError('unsupported file type, use a .csv or .parquet file: '
+                             '{path}'.format(path=path))
+    else:
+        frames = data
+
+    for frame in frames:
+        iter_ = 0
+        while iter_ < len(frame):
+            size = chunksize if tuner is None else tuner.chunksize
+            yield frame[iter_: iter_ + size]
+            iter_ += size
 
-    diff = datetime.now() - start
-    print('committed data in {time} hours'.format(time=str(diff)))
+
+def __chunk_writer(mode: str, target_table: str, columns: List[str], table_: str,
+                   engine: Engine):
+    """
+    write statement, chunk encoder and chunk sender of a write mode
+    :param mode: write mode (copy, binary or insert)
+    :param target_table: table the chunks are written to
+    :param columns: columns of the data
+    :param table_: full table name the column types are read from (binary mode)
+    :param engine: sqlalchemy engine
+    :return: (write statement, function(rows_chunk) -> (payload, bytes sent),
+        function(cursor_, write_statement, payload))
+    """
+    if mode == 'copy':
+        write_statement = COPY_STATEMENT.format(
+            schema_table=target_table, columns=', '.join(columns)
+        )
+        encode_chunk = __encode_chunk_copy
+        send_chunk = __send_chunk_copy
+    elif mode == 'binary':
+        write_statement = COPY_BINARY_STATEMENT.format(
+            schema_table=target_table, columns=', '.join(columns)
+        )
+        encode_chunk = partial(__encode_chunk_binary,
+                               column_types=__get_column_types(table_, engine),
+                               timezone=__get_session_timezone(engine))
+        send_chunk = __send_chunk_copy
+    else:
+        write_statement = INSERT_STATEMENT.format(
+            schema_table=target_table,
+            columns=', '.join(columns),
+            table_values=', '.join(['%s' for _ in columns])
+        )
+        encode_chunk = __encode_chunk_insert
+        send_chunk = __send_chunk_insert
+        register_adapter(np.int64, AsIs)
+    return write_statement, encode_chunk, send_chunk
+
+
+def __upsert_statement(schema_table: str, stage_table: str, columns: List[str],
+                       upsert_keys: List[str]) -> str:
+    """
+    INSERT ... ON CONFLICT statement merging a staging table into a table
+    :param schema_table: full table name
+    :param stage_table: staging table name
+    :param columns: columns of the data
+    :param upsert_keys: columns of the conflict key
+    :return: sql text
+    """
+    missing = [key for key in upsert_keys if key not in columns]
+    if missing:
+        raise ValueError('upsert keys not in data: {keys}'.format(keys=', '.join(missing)))
+
+    update_columns = [column for column in columns if column not in upsert_keys]
+    if update_columns:
+        conflict_action = 'DO UPDATE SET ' + ', '.join(
+            '{column} = EXCLUDED.{column}'.format(column=column) for column in update_columns
+        )
+    else:
+        conflict_action = 'DO NOTHING'
+    return UPSERT_STATEMENT.format(
+        schema_table=schema_table, columns=', '.join(columns), stage_table=stage_table,
+        keys=', '.join(upsert_keys), conflict_action=conflict_action
+    )
+
+
+def __encode_chunk_insert(rows_chunk: pd.DataFrame):
+    """
+    records of a chunk of rows for executemany INSERT statements
+    :param rows_chunk: pandas dataframe chunk
+    :return: (records, estimated bytes sent as the in memory size of the chunk)
+    """
+    return rows_chunk.to_records(index=False), int(rows_chunk.memory_usage(index=False).sum())
+
+
+def __encode_chunk_copy(rows_chunk: pd.DataFrame):
+    """
+    in-memory csv buffer of a chunk of rows for COPY ... FROM STDIN
+    :param rows_chunk: pandas dataframe chunk
+    :return: (csv bytes, bytes sent)
+    """
+    payload = encode_csv_copy(rows_chunk).encode('utf-8')
+    return payload, len(payload)
+
+
+def __encode_chunk_binary(rows_chunk: pd.DataFrame, column_types: dict, timezone: str = None):
+    """
+    binary COPY format buffer of a chunk of rows
+    :param rows_chunk: pandas dataframe chunk
+    :param column_types: column name -> (postgres udt_name, numeric scale)
+    :param timezone: TimeZone of the session for naive timestamptz values
+    :return: (binary COPY bytes, bytes sent)
+    """
+    payload = encode_binary_copy(rows_chunk, column_types, timezone=timezone)
+    return payload, len(payload)
+
+
+def __send_chunk_insert(cursor_, write_statement: str, payload):
+    """
+    write records using executemany INSERT statements
+    :param cursor_: psycopg2 cursor
+    :param write_statement: INSERT statement with %s placeholders
+    :param payload: records of __encode_chunk_insert
+    """
+    cursor_.executemany(write_statement, payload)
+
+
+def __send_chunk_copy(cursor_, write_statement: str, payload: bytes):
+    """
+    stream an encoded chunk through COPY ... FROM STDIN
+    :param cursor_: psycopg2 cursor
+    :param write_statement: COPY statement (csv or binary)
+    :param payload: bytes of __encode_chunk_copy or __encode_chunk_binary
+    """
+    cursor_.copy_expert(write_statement, io.BytesIO(payload))
 
 
 def run_sql(sql_text: str, engine: Engine, **parameters) -> bool:
@@ -116,73 +1235,35 @@ def run_sql(sql_text: str, engine: Engine, **parameters) -> bool:
 def __get_db_object(object_name: str, engine: Engine, schema_name: str = None,
                     is_table: bool = True):
     """
-    postgres queries to check for schema name or table name
+    check for schema name and table name against the cached catalog of the engine
     :param object_name: objectname (stored procedure, table)
     :param engine: sqlalchemy engine
     :param schema_name: schema_name (if table is object)
     :param is_table: whether the object is table
     :return: str of full object_name (SCHEMA_NAME.OBJECT_NAME)
     """
-    if object_name is None:
-        raise Exception('Objectname cannot be null')
-
-    # check if schema is valid
-    if schema_name is not None:
-        query = "SELECT schema_name FROM information_schema.schemata " \
-                "where schema_name= :schema_name"
-        db_schema = read_sql(sql_text=query, engine=engine, schema_name=schema_name.lower())
-
-        if db_schema.shape[0] == 0:
-            raise Exception('Schema name: {schema} not found'.format(schema=object_name))
-
-    # check if table is valid
-    if schema_name is not None:
-        if is_table:
-            sql_text = """
-                select
-                    table_schema || '.' || table_name as table_name
-                from information_schema.tables
-                where 
-                    table_type = 'BASE TABLE' and table_schema = :schema_name and 
-                    table_name = :table_name and table_schema NOT IN (
-                        'pg_catalog', 'information_schema'
-                    )
-            """
-        else:
-            sql_text = """
-                SELECT  proowner || '.' || proname as table_name
-                FROM    pg_catalog.pg_namespace n JOIN pg_catalog.pg_proc p
-                    ON pronamespace = n.oid
-                WHERE 
-                    nspname = 'public' and proowner = :schema_name and
-                    proname = :table_name
-            """
-        db_table = read_sql(sql_text=sql_text, engine=engine,
-                            schema_name=schema_name.lower(), table_name=object_name.lower())
-    else:
-        if is_table:
-            sql_text = """
-                select
-                    table_schema || '.' || table_name as table_name
-                from information_schema.tables
-                where 
-                    table_type = 'BASE TABLE' and  table_name = :table_name and 
-                    table_schema NOT IN (
-                        'pg_catalog', 'information_schema'
-                    )
-            """
-        else:
-            sql_text = """
-                SELECT  proowner || '.' || proname as table_name
-                FROM    pg_catalog.pg_namespace n JOIN pg_catalog.pg_proc p
-                    ON pronamespace = n.oid
-                WHERE 
-                    nspname = 'public' and proname = :table_name
-            """
-        db_table = read_sql(sql_text=sql_text, engine=engine, table_name=object_name.lower())
-
-    if db_table.shape[0] == 0:
-        raise Exception('specified object not found: {object_}'.format(object_=object_name))
-
-    table_ = db_table.iloc[0, 0]
-    return table_
+    return get_catalog_cache(engine).resolve(object_name=object_name, schema_name=schema_name,
+                                             is_table=is_table)
+
+
+def __get_column_types(table_: str, engine: Engine) -> dict:
+    """
+    postgres query for the column types of a table
+    :param table_: full table name (SCHEMA_NAME.TABLE_NAME)
+    :param engine: sqlalchemy engine
+    :return: dict of column name -> (udt_name, numeric_scale)
+    """
+    schema_name, table_name = table_.split('.', 1)
+    db_columns = read_sql(sql_text=COLUMN_TYPES_QUERY, engine=engine,
+                          schema_name=schema_name, table_name=table_name)
+    return column_types_from_rows(db_columns.itertuples(index=False))
+
+
+def __get_session_timezone(engine: Engine) -> str:
+    """
+    TimeZone setting of the sessions of an engine, the server reads naive timestamps
+    sent as text to timestamptz columns in it
+    :param engine: sqlalchemy engine
+    :return: timezone name (ex. UTC, America/New_York)
+    """
+    return read_sql(sql_text=TIMEZONE_QUERY, engine=engine)['timezone'][0]
@@ -0,0 +1,264 @@
+"""
+Long-lived writers on top of db_utils.to_sql for ingestion code producing
+dataframes over time (ex. vendor feed handlers)
+"""
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy.engine.base import Engine
+
+from .db_load import LoadMetrics
+from .db_utils import to_sql
+
+LOGGER = logging.getLogger(__name__)
+QUEUE_SIZE = 8
+PUT_TIMEOUT = 0.1
+FLUSH_ROWS = 100000
+FLUSH_BYTES = 16 * 1024 * 1024
+FLUSH_INTERVAL = 5.0
+_ABORT = object()
+
+
+class PipelinedWriter:
+    """
+    producer API of a pipelined to_sql load. Frames pushed with put() go through a
+    bounded queue to a background to_sql(pipeline=True), which encodes the next chunk
+    while the current one is on the wire. put() blocks once the queue is full, so a
+    producer faster than the database is slowed down instead of filling the memory.
+    The load is one transaction committed by close(), rolled back by abort()
+    or an exception inside the with block
+    (usage: with PipelinedWriter(engine, 'equity', 'exchange') as writer:
+                writer.put(frame))
+    """
+    def __init__(self, engine: Engine, table_name: str, schema_name: str = None,
+                 queue_size: int = QUEUE_SIZE, **to_sql_options):
+        """
+        constructor for the class, starts the background load
+        :param engine: sqlalchemy engine
+        :param table_name: table name in the database
+        :param schema_name: schema name in which the table is location
+            (default is None)
+        :param queue_size: number of frames waiting for the load before put() blocks
+        :param to_sql_options: (optional) other to_sql arguments
+            (usage: chunksize='auto', mode='binary')
+        """
+        self._frames = queue.Queue(maxsize=queue_size)
+        self._metrics = None
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._load, daemon=True,
+            kwargs=dict(engine=engine, table_name=table_name, schema_name=schema_name,
+                        **dict(to_sql_options, pipeline=True))
+        )
+        self._thread.start()
+
+    def _load(self, **to_sql_arguments):
+        try:
+            self._metrics = to_sql(self._queued_frames(), **to_sql_arguments)
+        except Exception as error:  # pylint: disable=broad-except
+            self._error = error
+
+    def _queued_frames(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                return
+            if frame is _ABORT:
+                raise Exception('load aborted by the producer')
+            yield frame
+
+    def put(self, frame: pd.DataFrame):
+        """
+        push a frame into the load, waits while the queue is full
+        :param frame: pandas dataframe with the columns of the table
+        """
+        if self._closed:
+            raise Exception('writer is closed')
+        while True:
+            self._raise_error()
+            try:
+                self._frames.put(frame, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                if not self._thread.is_alive():
+                    self._raise_error()
+                    raise Exception('load stopped before the end of the data')
+
+    def close(self) -> LoadMetrics:
+        """
+        end the data, wait for the load to commit
+        :return: LoadMetrics of the load
+        """
+        self._finish(None)
+        self._raise_error()
+        return self._metrics
+
+    def abort(self):
+        """
+        end the data, wait for the load to roll back
+        """
+        self._finish(_ABORT)
+
+    def _finish(self, marker):
+        if self._closed:
+            return
+        self._closed = True
+        while self._thread.is_alive():
+            try:
+                self._frames.put(marker, timeout=PUT_TIMEOUT)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise Exception('pipelined load failed: {error}'.format(
+                error=self._error)) from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class BufferedWriter:
+    """
+    micro-batching writer of one table for many small frames. Frames given to write()
+    are buffered and written by one to_sql call (one pooled connection, one commit)
+    once the buffer holds flush_rows rows or flush_bytes bytes, or its oldest frame
+    is flush_interval seconds old. A failed flush keeps the frames in the buffer.
+    With upsert_keys (or delta_keys) only the last buffered row of each key is written,
+    as one upsert statement can not update a row twice
+    (usage: with BufferedWriter(engine, 'equity', 'exchange', flush_interval=1) as writer:
+                writer.write(frame))
+    """
+    def __init__(self, engine: Engine, table_name: str, schema_name: str = None,
+                 flush_rows: int = FLUSH_ROWS, flush_bytes: int = FLUSH_BYTES,
+                 flush_interval: float = FLUSH_INTERVAL, **to_sql_options):
+        """
+        constructor for the class, starts the interval flush thread
+        :param engine: sqlalchemy engine
+        :param table_name: table name in the database
+        :param schema_name: schema name in which the table is location
+            (default is None)
+        :param flush_rows: buffered rows triggering a flush (None to disable)
+        :param flush_bytes: buffered bytes triggering a flush (None to disable)
+        :param flush_interval: seconds a frame waits in the buffer at most (None to disable)
+        :param to_sql_options: (optional) other to_sql arguments
+            (usage: mode='binary', upsert_keys=['id'])
+        """
+        self.engine = engine
+        self.table_name = table_name
+        self.schema_name = schema_name
+        self.flush_rows = flush_rows
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.to_sql_options = to_sql_options
+        self.metrics = LoadMetrics(table_name=table_name)
+        self._frames = list()
+        self._rows = 0
+        self._bytes = 0
+        self._first_write = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if flush_interval is not None:
+            self._thread = threading.Thread(target=self._flush_on_interval, daemon=True)
+            self._thread.start()
+
+    def write(self, frame: pd.DataFrame):
+        """
+        buffer a frame, flushes when the row or byte limit is reached
+        :param frame: pandas dataframe with the columns of the table
+        """
+        if self._closed:
+            raise Exception('writer is closed')
+        if frame.empty:
+            return
+        with self._lock:
+            self._frames.append(frame)
+            self._rows += len(frame)
+            self._bytes += int(frame.memory_usage(index=False, deep=True).sum())
+            if self._first_write is None:
+                self._first_write = time.monotonic()
+            full = ((self.flush_rows is not None and self._rows >= self.flush_rows) or
+                    (self.flush_bytes is not None and self._bytes >= self.flush_bytes))
+        if full:
+            self.flush()
+
+    def flush(self) -> LoadMetrics:
+        """
+        write the buffered frames in one to_sql call
+        :return: LoadMetrics of the flush (None when the buffer is empty)
+        """
+        with self._flush_lock:
+            with self._lock:
+                frames, self._frames = self._frames, list()
+                rows, bytes_ = self._rows, self._bytes
+                self._rows, self._bytes, self._first_write = 0, 0, None
+            if not frames:
+                return None
+            data = pd.concat(frames, ignore_index=True)
+            keys = self.to_sql_options.get('upsert_keys') or self.to_sql_options.get('delta_keys')
+            if keys:
+                data = data.drop_duplicates(subset=keys, keep='last', ignore_index=True)
+            try:
+                metrics = to_sql(data, self.engine, self.table_name, schema_name=self.schema_name,
+                                 **self.to_sql_options)
+            except Exception:
+                with self._lock:
+                    self._frames = frames + self._frames
+                    self._rows += rows
+                    self._bytes += bytes_
+                    self._first_write = time.monotonic()
+                raise
+            self.metrics.rows_written += metrics.rows_written
+            self.metrics.bytes_sent += metrics.bytes_sent
+            self.metrics.chunk_count += metrics.chunk_count
+            self.metrics.encode_seconds += metrics.encode_seconds
+            self.metrics.server_seconds += metrics.server_seconds
+            self.metrics.total_seconds += metrics.total_seconds
+            self.metrics.chunk_seconds.extend(metrics.chunk_seconds)
+            return metrics
+
+    def close(self) -> LoadMetrics:
+        """
+        stop the interval flush thread and flush the buffer
+        :return: LoadMetrics summed over all flushes of the writer
+        """
+        if not self._closed:
+            self._closed = True
+            self._stopped.set()
+            if self._thread is not None:
+                self._thread.join()
+        self.flush()
+        return self.metrics
+
+    def _flush_on_interval(self):
+        while not self._stopped.wait(min(self.flush_interval, 1.0)):
+            with self._lock:
+                due = (self._first_write is not None and
+                       time.monotonic() - self._first_write >= self.flush_interval)
+            if due:
+                try:
+                    self.flush()
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception('interval flush of %s failed, the frames are kept',
+                                     self.table_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -8,7 +8,26 @@ to generate connection strings and orm objects """
 # pylint: skip-file 
 
 import os 
+import threading 
 from sqlalchemy import create_engine 
 
-quant_database_engine = create_engine('postgres://' + os.environ['quant_user'] + ':' + os.environ['quant_password'] + '@' + os.environ['quant_host'] + ':5432/' + os.environ['quant_database'])
+# engines are created on first access and cached, so a process only pays for the engines it uses
+_ENGINE_FACTORIES = {
+    'quant_database_engine': lambda: create_engine('postgresql://' + os.environ['quant_user'] + ':' + os.environ['quant_password'] + '@' + os.environ['quant_host'] + ':5432/' + os.environ['quant_database']),
+}
 
+_ENGINES = dict()
+_ENGINES_LOCK = threading.RLock()
+
+
+def __getattr__(name):
+    if name not in _ENGINE_FACTORIES:
+        raise AttributeError('module {module!r} has no attribute {name!r}'.format(module=__name__, name=name))
+    with _ENGINES_LOCK:
+        if name not in _ENGINES:
+            _ENGINES[name] = _ENGINE_FACTORIES[name]()
+    return _ENGINES[name]
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_ENGINE_FACTORIES))
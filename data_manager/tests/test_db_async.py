@@ -0,0 +1,91 @@
+"""
+Test Cases for the asyncio database utils, without a database
+"""
+
+# pylint: skip-file
+
+import asyncio
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from parameterized import parameterized
+
+from data_manager import db_async
+from data_manager.db_cache import QueryCache
+
+decode_numeric = getattr(db_async, '__decode_numeric')
+insert_records = getattr(db_async, '__insert_records')
+
+
+def engine():
+    """
+    async engine stand-in, connect() raises as no query should reach the database
+    """
+    engine_ = mock.Mock(name='engine')
+    engine_.sync_engine.url = 'postgresql+asyncpg://test'
+    engine_.connect.side_effect = AssertionError('database reached')
+    return engine_
+
+
+class TestReadSql(unittest.TestCase):
+    """
+    class to test the read options of the async read_sql
+    """
+    @parameterized.expand([
+        ('mode', dict(mode='copy')),
+        ('numeric_dtype', dict(numeric_dtype='float32')),
+    ])
+    def test_rejected_options(self, name, options):
+        with self.assertRaises(ValueError):
+            asyncio.run(db_async.read_sql('select 1', engine(), **options))
+
+    def test_cache_hit(self):
+        cache = QueryCache()
+        engine_ = engine()
+        data = pd.DataFrame({'id': [1]})
+        key = cache.make_key('select 1', {}, engine=engine_.sync_engine, mode='rows',
+                             numeric_dtype=None, numeric_scale=4, cache_token='2024-01-02')
+        cache.put(key, data)
+        out_ = asyncio.run(db_async.read_sql('select  1;', engine_, cache=cache,
+                                             cache_token='2024-01-02'))
+        pd.testing.assert_frame_equal(out_, data)
+        with self.assertRaises(AssertionError):
+            asyncio.run(db_async.read_sql('select 1', engine_, cache=cache,
+                                          cache_token='2024-01-03'))
+
+
+class TestDecodeNumeric(unittest.TestCase):
+    """
+    class to test the NUMERIC dtype policies applied to fetched values
+    """
+    def test_float64(self):
+        out_ = decode_numeric([Decimal('12.50'), None], 'float64')
+        self.assertEqual(out_.dtype, np.float64)
+        self.assertEqual(out_[0], 12.5)
+        self.assertTrue(np.isnan(out_[1]))
+
+    def test_int64(self):
+        out_ = decode_numeric([Decimal('12.5'), None, Decimal('-1.23455')], 'int64', 4)
+        self.assertEqual(out_.dtype, pd.Int64Dtype())
+        self.assertEqual(out_.tolist(), [125000, pd.NA, -12346])
+
+
+class TestInsertRecords(unittest.TestCase):
+    """
+    class to test the rows given to executemany by the insert mode
+    """
+    def test_records(self):
+        data = pd.DataFrame({
+            'id': [1, 2],
+            'px': [1.5, np.nan],
+            'name': ['a', None],
+            'trade_date': [pd.Timestamp('2024-01-02'), pd.NaT],
+        })
+        records = insert_records(data)
+        self.assertEqual(records, [(1, 1.5, 'a', pd.Timestamp('2024-01-02')),
+                                   (2, None, None, None)])
+        self.assertIs(type(records[0][0]), int)
+        self.assertIs(type(records[0][1]), float)
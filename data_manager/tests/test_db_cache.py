@@ -0,0 +1,227 @@
+"""
+Test Cases for the database lookup caches
+"""
+
+# pylint: skip-file
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+from parameterized import parameterized
+
+from data_manager.db_cache import CatalogCache, DiskQueryCache, QueryCache
+
+CATALOG_ROWS = [
+    ('schema', 'public', None),
+    ('schema', 'research', None),
+    ('table', 'research', 'prices'),
+    ('table', 'public', 'prices'),
+    ('table', 'research', 'trades'),
+    ('function', 'public', 'refresh_prices'),
+    ('function', 'research', 'load_trades'),
+]
+
+
+class TestCatalogCache(unittest.TestCase):
+    """
+    class to test the catalog cache without a database
+    """
+    def setUp(self):
+        self.cache = CatalogCache(engine=None)
+        self.loads = 0
+
+        def refresh():
+            self.loads += 1
+            self.cache.load(CATALOG_ROWS)
+        self.cache.refresh = refresh
+
+    @parameterized.expand([
+        ('first_schema', 'prices', None, True, 'public.prices'),
+        ('schema', 'prices', 'research', True, 'research.prices'),
+        ('case', 'TRADES', 'Research', True, 'research.trades'),
+        ('function_default_schema', 'refresh_prices', None, False, 'public.refresh_prices'),
+        ('function_schema', 'load_trades', 'research', False, 'research.load_trades'),
+    ])
+    def test_resolve(self, _, object_name, schema_name, is_table, expected):
+        self.assertEqual(self.cache.resolve(object_name, schema_name=schema_name,
+                                            is_table=is_table), expected)
+
+    def test_resolve_many_loads_once(self):
+        out_ = self.cache.resolve_many(['prices', 'trades'])
+        self.assertEqual(out_, {'prices': 'public.prices', 'trades': 'research.trades'})
+        self.cache.resolve_many(['prices'], schema_name='research')
+        self.assertEqual(self.loads, 1)
+
+    @parameterized.expand([
+        ('object', ['missing'], None),
+        ('schema', ['prices'], 'missing'),
+        ('object_in_schema', ['trades'], 'public'),
+        ('null', [None], None),
+    ])
+    def test_resolve_many_missing(self, _, object_names, schema_name):
+        self.cache.load(CATALOG_ROWS)
+        with self.assertRaises(Exception):
+            self.cache.resolve_many(object_names, schema_name=schema_name)
+
+    def test_missing_object_reloads_once(self):
+        self.cache.load(CATALOG_ROWS[:3])
+        self.assertEqual(self.cache.resolve('trades'), 'research.trades')
+        self.assertEqual(self.loads, 1)
+
+    def test_without_refresh(self):
+        self.cache.load(CATALOG_ROWS[:3])
+        with self.assertRaises(Exception):
+            self.cache.resolve_many(['trades'], refresh=False)
+        self.assertEqual(self.loads, 0)
+
+    def test_expiry_and_invalidate(self):
+        self.assertTrue(self.cache.is_expired())
+        self.cache.load(CATALOG_ROWS)
+        self.assertFalse(self.cache.is_expired())
+        self.cache.invalidate()
+        self.assertTrue(self.cache.is_expired())
+        self.cache.ttl = 0
+        self.cache.resolve('prices')
+        self.cache.resolve('prices')
+        self.assertEqual(self.loads, 2)
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    class to test the in-process query result cache
+    """
+    @parameterized.expand([
+        ('whitespace', 'select *\n  from t\twhere a = 1;', 'select * from t where a = 1'),
+        ('literal', "select * from t where a = 'x  y'", "select * from t where a = 'x  y'"),
+        ('escaped_quote', "select 'it''s  ok'  from t", "select 'it''s  ok' from t"),
+        ('identifier', 'select "My  Col"  from t', 'select "My  Col" from t'),
+    ])
+    def test_normalize_sql(self, _, sql_text, expected):
+        self.assertEqual(QueryCache.normalize_sql(sql_text), expected)
+
+    def test_keys(self):
+        key = QueryCache.make_key('select * from t where a = :a', dict(a=1), mode='rows')
+        self.assertEqual(key, QueryCache.make_key(' select *  from t\nwhere a = :a ; ',
+                                                  dict(a=1), mode='rows'))
+        self.assertNotEqual(key, QueryCache.make_key('select * from t where a = :a',
+                                                     dict(a=2), mode='rows'))
+        self.assertNotEqual(key, QueryCache.make_key('select * from t where a = :a',
+                                                     dict(a=1), mode='copy'))
+        self.assertNotEqual(QueryCache.make_key("select 'a  b'", dict()),
+                            QueryCache.make_key("select 'a b'", dict()))
+
+    def test_get_put(self):
+        cache = QueryCache()
+        key = QueryCache.make_key('select * from t', dict())
+        self.assertIsNone(cache.get(key))
+        cache.put(key, pd.DataFrame({'a': [1]}))
+        out_ = cache.get(key)
+        out_['a'] = 2
+        self.assertEqual(cache.get(key)['a'].tolist(), [1])
+        self.assertEqual(cache.stats(), dict(hits=2, misses=1, evictions=0, size=1))
+
+    def test_eviction(self):
+        cache = QueryCache(maxsize=2)
+        keys = [QueryCache.make_key('select {idx}'.format(idx=idx), dict()) for idx in range(3)]
+        cache.put(keys[0], pd.DataFrame())
+        cache.put(keys[1], pd.DataFrame())
+        cache.get(keys[0])
+        cache.put(keys[2], pd.DataFrame())
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=None)
+        key = QueryCache.make_key('select 1', dict())
+        cache.put(key, pd.DataFrame(), ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_invalidate(self):
+        cache = QueryCache()
+        prices = QueryCache.make_key('select * from research.prices p join trades t on 1=1',
+                                     dict())
+        other = QueryCache.make_key('select * from "Other"', dict())
+        cache.put(prices, pd.DataFrame())
+        cache.put(other, pd.DataFrame())
+        self.assertEqual(cache.invalidate('trades'), 1)
+        self.assertIsNone(cache.get(prices))
+        self.assertEqual(cache.invalidate('public.other'), 0)
+        self.assertEqual(cache.invalidate('other'), 1)
+        cache.put(prices, pd.DataFrame())
+        self.assertEqual(cache.invalidate(), 1)
+
+
+class TestDiskQueryCache(unittest.TestCase):
+    """
+    class to test the query result cache persisted as feather files
+    """
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_round_trip(self):
+        data = pd.DataFrame({'id': [1, 2], 'px': [1.5, None], 'name': ['a', 'b'],
+                             'trade_date': [pd.Timestamp('2024-01-02'), pd.NaT]},
+                            index=[5, 6])
+        key = QueryCache.make_key('select * from prices', dict())
+        cache = DiskQueryCache(self.cache_dir)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, data)
+        out_ = DiskQueryCache(self.cache_dir).get(key)
+        pd.testing.assert_frame_equal(out_, data.reset_index(drop=True), check_dtype=False)
+        self.assertEqual(cache.stats(), dict(hits=0, misses=1, evictions=0, size=1))
+
+    def test_ttl(self):
+        cache = DiskQueryCache(self.cache_dir)
+        key = QueryCache.make_key('select 1', dict())
+        cache.put(key, pd.DataFrame({'a': [1]}), ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_eviction(self):
+        cache = DiskQueryCache(self.cache_dir, maxsize=2)
+        keys = [QueryCache.make_key('select {idx}'.format(idx=idx), dict()) for idx in range(3)]
+        for key in keys[:2]:
+            cache.put(key, pd.DataFrame({'a': [1]}))
+            time.sleep(0.02)
+        cache.get(keys[0])
+        time.sleep(0.02)
+        cache.put(keys[2], pd.DataFrame({'a': [1]}))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_invalidate(self):
+        cache = DiskQueryCache(self.cache_dir)
+        prices = QueryCache.make_key('select * from research.prices p join trades t on 1=1',
+                                     dict())
+        other = QueryCache.make_key('select * from "Other"', dict())
+        cache.put(prices, pd.DataFrame({'a': [1]}))
+        cache.put(other, pd.DataFrame({'a': [1]}))
+        self.assertEqual(cache.invalidate('trades'), 1)
+        self.assertIsNone(cache.get(prices))
+        self.assertIsNotNone(cache.get(other))
+        self.assertEqual(cache.invalidate('public.other'), 0)
+        self.assertEqual(cache.invalidate('other'), 1)
+        cache.put(prices, pd.DataFrame({'a': [1]}))
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_cache_token(self):
+        cache = DiskQueryCache(self.cache_dir)
+        key = QueryCache.make_key('select * from prices', dict(), cache_token='2024-01-02')
+        cache.put(key, pd.DataFrame({'a': [1]}))
+        self.assertIsNotNone(cache.get(
+            QueryCache.make_key('select * from prices', dict(), cache_token='2024-01-02')))
+        self.assertIsNone(cache.get(
+            QueryCache.make_key('select * from prices', dict(), cache_token='2024-01-03')))
@@ -0,0 +1,256 @@
+"""
+Test Cases for the COPY encoders and decoders
+"""
+
+# pylint: skip-file
+
+import hashlib
+import io
+import struct
+import unittest
+from collections import namedtuple
+from decimal import Decimal, localcontext
+
+import numpy as np
+import pandas as pd
+from parameterized import parameterized
+
+from data_manager.db_copy import (
+    COPY_HEADER, COPY_TRAILER, decode_csv_copy, encode_binary_copy, encode_csv_copy,
+    row_hash_expression, row_hashes
+)
+
+Column = namedtuple('Column', 'name type_code')
+
+
+class TestDecodeCsvCopy(unittest.TestCase):
+    """
+    class to test the COPY TO csv parser
+    """
+    def test_typed_columns(self):
+        description = [Column('id', 20), Column('qty', 23), Column('px', 701),
+                       Column('flag', 16), Column('sym', 25)]
+        buffer_ = io.BytesIO(b'1,10,1.5,t,abc\n2,\\N,\\N,f,\\N\n')
+        out_ = decode_csv_copy(buffer_, description)
+        self.assertEqual(out_.columns.tolist(), ['id', 'qty', 'px', 'flag', 'sym'])
+        self.assertEqual(str(out_['id'].dtype), 'Int64')
+        self.assertEqual(str(out_['qty'].dtype), 'Int32')
+        self.assertEqual(out_['px'].dtype, np.float64)
+        self.assertEqual(out_['flag'].tolist(), [True, False])
+        self.assertTrue(pd.isna(out_['qty'][1]))
+        self.assertTrue(pd.isna(out_['sym'][1]))
+        self.assertEqual(out_['sym'][0], 'abc')
+
+    def test_text_null_marker(self):
+        out_ = decode_csv_copy(io.BytesIO(b'"",\\N\n'), [Column('a', 25), Column('b', 25)])
+        self.assertEqual(out_['a'][0], '')
+        self.assertTrue(pd.isna(out_['b'][0]))
+
+    def test_mixed_fractional_seconds(self):
+        description = [Column('ts', 1114), Column('tz', 1184), Column('d', 1082)]
+        buffer_ = io.BytesIO(b'2021-01-01 10:00:00,2021-01-01 10:00:00+00,2021-01-01\n'
+                             b'2021-01-01 10:00:00.123456,2021-01-01 10:00:00.5+00,\\N\n')
+        out_ = decode_csv_copy(buffer_, description)
+        self.assertEqual(out_['ts'][1], pd.Timestamp('2021-01-01 10:00:00.123456'))
+        self.assertEqual(out_['tz'][1], pd.Timestamp('2021-01-01 10:00:00.5', tz='UTC'))
+        self.assertEqual(out_['d'][0], pd.Timestamp('2021-01-01'))
+        self.assertTrue(pd.isna(out_['d'][1]))
+
+    def test_decimal_policy(self):
+        out_ = decode_csv_copy(io.BytesIO(b'12.50\n\\N\n'), [Column('px', 1700)],
+                               numeric_dtype='decimal')
+        self.assertEqual(out_['px'][0], Decimal('12.50'))
+        self.assertIsNone(out_['px'][1])
+
+
+class TestEncodeCsvCopy(unittest.TestCase):
+    """
+    class to test the COPY FROM csv encoder
+    """
+    @parameterized.expand([
+        ('without_nulls', [1.0, 2.0], '1\n2\n'),
+        ('with_nulls', [1.0, np.nan], '1\n\\N\n'),
+        ('fractional', [1.5, 2.0], '1.5\n2.0\n'),
+        ('all_null', [np.nan, np.nan], '\\N\n\\N\n'),
+        ('past_int64', [1e20, 1.0], '1e+20\n1.0\n'),
+    ])
+    def test_whole_floats(self, _, values, expected):
+        self.assertEqual(encode_csv_copy(pd.DataFrame({'a': values})), expected)
+
+    @parameterized.expand([
+        ('object', pd.Series(['\\N', None, 'a,"b"'], dtype=object)),
+        ('string', pd.Series(['\\N', None, 'a,"b"'], dtype='string')),
+    ])
+    def test_null_marker_text(self, _, values):
+        out_ = encode_csv_copy(pd.DataFrame({'a': values, 'b': [1, 2, 3]}))
+        self.assertEqual(out_, '"\\N",1\n\\N,2\n"a,""b""",3\n')
+
+    def test_without_null_marker_text(self):
+        self.assertEqual(encode_csv_copy(pd.DataFrame({'a': ['x\\N', None]})), 'x\\N\n\\N\n')
+
+
+def read_binary_copy(payload):
+    """
+    fields of each row of a binary COPY payload, None for null
+    """
+    assert payload.startswith(COPY_HEADER) and payload.endswith(COPY_TRAILER)
+    buffer_ = io.BytesIO(payload[len(COPY_HEADER):-len(COPY_TRAILER)])
+    rows = list()
+    while True:
+        head = buffer_.read(2)
+        if not head:
+            return rows
+        row = list()
+        for _ in range(struct.unpack('>h', head)[0]):
+            length = struct.unpack('>i', buffer_.read(4))[0]
+            row.append(None if length == -1 else buffer_.read(length))
+        rows.append(row)
+
+
+def numeric_value(field):
+    """
+    Decimal of a numeric_send field
+    """
+    ndigits, weight, sign, dscale = struct.unpack('>hhHH', field[:8])
+    digits = struct.unpack('>{n}h'.format(n=ndigits), field[8:])
+    with localcontext() as context:
+        context.prec = 1000
+        value = sum(Decimal(digit) * Decimal(10000) ** (weight - idx)
+                    for idx, digit in enumerate(digits))
+        return (-value if sign == 0x4000 else value).quantize(Decimal(1).scaleb(-dscale))
+
+
+class TestEncodeBinaryCopy(unittest.TestCase):
+    """
+    class to test the binary COPY encoder
+    """
+    column_types = {'id': ('int8', None), 'qty': ('int4', None), 'px': ('float8', None),
+                    'flag': ('bool', None), 'sym': ('text', None), 'amt': ('numeric', 2),
+                    'ts': ('timestamp', None), 'day': ('date', None)}
+
+    def test_round_trip(self):
+        data = pd.DataFrame({
+            'id': [1, 2**40], 'qty': pd.array([7, None], dtype='Int32'), 'px': [1.5, np.nan],
+            'flag': [True, False], 'sym': ['abc', None], 'amt': [12.5, -0.01],
+            'ts': [pd.Timestamp('2000-01-01 00:00:01'), pd.Timestamp('1999-12-31 23:59:59.5')],
+            'day': [pd.Timestamp('2000-01-02'), pd.NaT],
+        })
+        rows = read_binary_copy(encode_binary_copy(data, self.column_types))
+        self.assertEqual(len(rows), 2)
+        first, second = rows
+        self.assertEqual(struct.unpack('>q', first[0])[0], 1)
+        self.assertEqual(struct.unpack('>q', second[0])[0], 2**40)
+        self.assertEqual(struct.unpack('>i', first[1])[0], 7)
+        self.assertIsNone(second[1])
+        self.assertEqual(struct.unpack('>d', first[2])[0], 1.5)
+        self.assertIsNone(second[2])
+        self.assertEqual((first[3], second[3]), (b'\x01', b'\x00'))
+        self.assertEqual(first[4], b'abc')
+        self.assertIsNone(second[4])
+        self.assertEqual(numeric_value(first[5]), Decimal('12.50'))
+        self.assertEqual(numeric_value(second[5]), Decimal('-0.01'))
+        self.assertEqual(struct.unpack('>q', first[6])[0], 1000000)
+        self.assertEqual(struct.unpack('>q', second[6])[0], -500000)
+        self.assertEqual(struct.unpack('>i', first[7])[0], 1)
+        self.assertIsNone(second[7])
+
+    def test_empty(self):
+        payload = encode_binary_copy(pd.DataFrame({'id': pd.Series([], dtype='int64')}),
+                                     self.column_types)
+        self.assertEqual(payload, COPY_HEADER + COPY_TRAILER)
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            encode_binary_copy(pd.DataFrame({'other': [1]}), self.column_types)
+
+    @parameterized.expand([
+        ('float_past_int64', [1e15 - 1, -123.45], 4,
+         [Decimal('999999999999999.0000'), Decimal('-123.4500')]),
+        ('float_past_int64_scale', [1e8 + 0.5], 10, [Decimal('100000000.5000000000')]),
+        ('decimal_past_int64', [Decimal('12345678901234567890.1234567890'), Decimal(1)], 10,
+         [Decimal('12345678901234567890.1234567890'), Decimal('1.0000000000')]),
+    ])
+    def test_large_numeric(self, _, values, scale, expected):
+        rows = read_binary_copy(encode_binary_copy(pd.DataFrame({'amt': values}),
+                                                   {'amt': ('numeric', scale)}))
+        self.assertEqual([numeric_value(row[0]) for row in rows], expected)
+
+    def test_numeric_rounding(self):
+        column_types = {'amt': ('numeric', 2)}
+        floats = encode_binary_copy(pd.DataFrame({'amt': [0.125, -0.125, 2.675]}), column_types)
+        decimals = encode_binary_copy(
+            pd.DataFrame({'amt': [Decimal('0.125'), Decimal('-0.125'), Decimal('2.675')]}),
+            column_types)
+        self.assertEqual(floats, decimals)
+        self.assertEqual([numeric_value(row[0]) for row in read_binary_copy(floats)],
+                         [Decimal('0.13'), Decimal('-0.13'), Decimal('2.68')])
+
+    def test_whole_floats_to_integer(self):
+        rows = read_binary_copy(encode_binary_copy(pd.DataFrame({'qty': [1.0, np.nan]}),
+                                                   self.column_types))
+        self.assertEqual(struct.unpack('>i', rows[0][0])[0], 1)
+        self.assertIsNone(rows[1][0])
+
+    def test_fractional_floats_to_integer(self):
+        with self.assertRaises(ValueError):
+            encode_binary_copy(pd.DataFrame({'qty': [1.0, 1.5]}), self.column_types)
+
+    def test_timestamptz(self):
+        column_types = {'ts': ('timestamptz', None)}
+        aware = pd.DataFrame({'ts': [pd.Timestamp('2000-01-01 05:00', tz='America/New_York')]})
+        naive = pd.DataFrame({'ts': [pd.Timestamp('2000-01-01 05:00')]})
+        expected = encode_binary_copy(aware, column_types)
+        self.assertEqual(read_binary_copy(expected)[0][0], struct.pack('>q', 36000 * 10**6))
+        self.assertEqual(encode_binary_copy(naive, column_types, timezone='America/New_York'),
+                         expected)
+        with self.assertRaises(ValueError):
+            encode_binary_copy(naive, column_types)
+
+
+class TestRowHashes(unittest.TestCase):
+    """
+    class to test the client side row hashes of delta loads
+    """
+    column_types = {'id': ('int8', None), 'sym': ('text', None), 'amt': ('numeric', 2),
+                    'note': ('varchar', None)}
+
+    def test_binary_fields(self):
+        data = pd.DataFrame({'id': [1], 'sym': ['ab'], 'amt': [12.5], 'note': [None]})
+        fields = (struct.pack('>iq', 8, 1) + struct.pack('>i', 2) + b'ab' +
+                  struct.pack('>i', 5) + b'12.50' + struct.pack('>i', -1))
+        self.assertEqual(row_hashes(data, self.column_types).tolist(),
+                         [hashlib.md5(fields).hexdigest()])
+
+    def test_equal_values(self):
+        data = pd.DataFrame({'id': [1, 2, 1], 'sym': ['a', 'b', 'a'],
+                             'amt': [Decimal('12.5'), Decimal('1'), Decimal('12.50')],
+                             'note': ['x', None, 'x']})
+        hashes = row_hashes(data, self.column_types)
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertNotEqual(hashes[0], hashes[1])
+        self.assertEqual(hashes.tolist(), row_hashes(data, self.column_types).tolist())
+
+    @parameterized.expand([
+        ('value', 'amt', 12.51),
+        ('null', 'note', None),
+        ('empty_text', 'sym', ''),
+    ])
+    def test_changed_value(self, _, column, value):
+        data = pd.DataFrame({'id': [1], 'sym': ['a'], 'amt': [12.5], 'note': ['x']})
+        changed = data.assign(**{column: [value]})
+        self.assertNotEqual(row_hashes(data, self.column_types)[0],
+                            row_hashes(changed, self.column_types)[0])
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            row_hashes(pd.DataFrame({'other': [1]}), self.column_types)
+        with self.assertRaises(ValueError):
+            row_hash_expression(['data'], {'data': ('jsonb', None)})
+
+    def test_expression(self):
+        self.assertEqual(
+            row_hash_expression(['id', 'amt'], self.column_types),
+            'md5(coalesce(int4send(length(int8send(id))) || int8send(id), int4send(-1)) || '
+            'coalesce(int4send(length(textsend(amt::text))) || textsend(amt::text), '
+            'int4send(-1)))'
+        )
@@ -0,0 +1,85 @@
+"""
+Test Cases for the bulk load helpers
+"""
+
+# pylint: skip-file
+
+import unittest
+
+from parameterized import parameterized
+
+from data_manager.db_load import MAX_GROWTH, ChunkSizeTuner, LoadMetrics
+
+
+class TestChunkSizeTuner(unittest.TestCase):
+    """
+    class to test the adaptive chunk size
+    """
+    @parameterized.expand([
+        ('initial', 10000, 10000),
+        ('below_min', 10, 1000),
+        ('above_max', 10**7, 500000),
+    ])
+    def test_initial_chunksize(self, _, initial_chunksize, expected):
+        self.assertEqual(ChunkSizeTuner(initial_chunksize=initial_chunksize).chunksize,
+                         expected)
+
+    def test_moves_half_way_to_byte_target(self):
+        tuner = ChunkSizeTuner(target_bytes=40000, target_seconds=100, initial_chunksize=1000,
+                               min_chunksize=1, max_chunksize=10**6)
+        # 10 bytes per row -> 4000 rows meet the byte target, half way (geometric) is 2000
+        tuner.observe(rows=1000, nbytes=10000, seconds=0.01)
+        self.assertEqual(tuner.chunksize, 2000)
+
+    def test_smaller_of_the_targets(self):
+        tuner = ChunkSizeTuner(target_bytes=10**9, target_seconds=1.0, initial_chunksize=1000,
+                               min_chunksize=1, max_chunksize=10**6)
+        # 1000 rows per second -> 1000 rows meet the latency target
+        tuner.observe(rows=1000, nbytes=1000, seconds=4.0)
+        self.assertEqual(tuner.chunksize, 500)
+
+    def test_growth_and_bounds(self):
+        tuner = ChunkSizeTuner(target_bytes=10**12, target_seconds=10**6, initial_chunksize=1000,
+                               min_chunksize=100, max_chunksize=10000)
+        tuner.observe(rows=1000, nbytes=1, seconds=1e-6)
+        self.assertEqual(tuner.chunksize, int(1000 * MAX_GROWTH))
+        for _ in range(5):
+            tuner.observe(rows=tuner.chunksize, nbytes=1, seconds=1e-6)
+        self.assertEqual(tuner.chunksize, 10000)
+
+        tuner = ChunkSizeTuner(target_bytes=1, initial_chunksize=1000, min_chunksize=100)
+        for _ in range(10):
+            tuner.observe(rows=tuner.chunksize, nbytes=10**9, seconds=1.0)
+        self.assertEqual(tuner.chunksize, 100)
+
+    @parameterized.expand([
+        ('no_rows', 0, 100, 1.0),
+        ('no_measure', 1000, 0, 0.0),
+    ])
+    def test_ignored_observation(self, _, rows, nbytes, seconds):
+        tuner = ChunkSizeTuner(initial_chunksize=5000)
+        tuner.observe(rows=rows, nbytes=nbytes, seconds=seconds)
+        self.assertEqual(tuner.chunksize, 5000)
+
+
+class TestLoadMetrics(unittest.TestCase):
+    """
+    class to test the load metrics
+    """
+    def test_record_chunk(self):
+        metrics = LoadMetrics(table_name='public.prices')
+        metrics.record_chunk(rows=100, nbytes=1000, seconds=1.0, encode_seconds=0.25)
+        metrics.record_chunk(rows=300, nbytes=None, seconds=3.0, encode_seconds=0.5)
+        metrics.total_seconds = 4.0
+        out_ = metrics.as_dict()
+        self.assertEqual(out_['rows_written'], 400)
+        self.assertEqual(out_['bytes_sent'], 1000)
+        self.assertEqual(out_['chunk_count'], 2)
+        self.assertAlmostEqual(out_['server_seconds'], 3.25)
+        self.assertEqual(out_['rows_per_second'], 100.0)
+        self.assertEqual(out_['chunk_p50_seconds'], 2.0)
+
+    def test_empty(self):
+        metrics = LoadMetrics()
+        self.assertEqual(metrics.rows_per_second, 0.0)
+        self.assertEqual(metrics.chunk_latency(99), 0.0)
@@ -0,0 +1,94 @@
+"""
+Test Cases for the read/write routing across primary and replica engines
+"""
+
+# pylint: skip-file
+
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from data_manager.db_routing import EngineRouter
+
+
+def engine(name, connects=True):
+    """
+    engine stand-in, connect() raises like an unreachable server when connects is False
+    """
+    engine_ = mock.Mock(name=name, url=name)
+    if not connects:
+        engine_.connect.side_effect = OperationalError('connect', {}, Exception('refused'))
+    return engine_
+
+
+def operational_error(connection_invalidated):
+    return OperationalError('select', {}, Exception('error'),
+                            connection_invalidated=connection_invalidated)
+
+
+class TestEngineRouter(unittest.TestCase):
+    """
+    class to test the engine order and the failover of the router
+    """
+    def setUp(self):
+        patcher = mock.patch('data_manager.db_routing.db_utils')
+        self.db_utils = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db_utils.read_sql.side_effect = lambda sql_text, engine_, **options: engine_.url
+        self.primary = engine('primary')
+
+    def test_round_robin(self):
+        replicas = [engine('replica_1'), engine('replica_2')]
+        router = EngineRouter(self.primary, replicas)
+        self.assertEqual(router.read_engines(), replicas + [self.primary])
+        self.assertEqual(router.read_engines(), replicas[::-1] + [self.primary])
+        self.assertEqual(router.read_engines(), replicas + [self.primary])
+        self.assertEqual([router.read_sql('select 1') for _ in range(3)],
+                         ['replica_2', 'replica_1', 'replica_2'])
+
+    def test_without_replicas(self):
+        router = EngineRouter(self.primary)
+        self.assertEqual(router.read_engines(), [self.primary])
+        self.assertEqual(router.read_sql('select 1'), 'primary')
+
+    def test_primary_reads(self):
+        router = EngineRouter(self.primary, [engine('replica_1')])
+        self.assertEqual(router.read_sql('select 1', primary=True), 'primary')
+        with router.read_your_writes():
+            with router.read_your_writes():
+                self.assertEqual(router.read_sql('select 1'), 'primary')
+            self.assertEqual(router.read_sql('select 1'), 'primary')
+        self.assertEqual(router.read_sql('select 1'), 'replica_1')
+
+    def test_writes_go_to_primary(self):
+        router = EngineRouter(self.primary, [engine('replica_1')])
+        router.to_sql('data', 'prices', mode='copy')
+        router.run_sql('delete from prices', id=1)
+        self.db_utils.to_sql.assert_called_once_with('data', self.primary, 'prices', mode='copy')
+        self.db_utils.run_sql.assert_called_once_with('delete from prices', self.primary, id=1)
+
+    def test_failover_on_connection_failure(self):
+        router = EngineRouter(self.primary, [engine('replica_1', connects=False),
+                                             engine('replica_2', connects=False)])
+        self.assertEqual(router.read_sql('select 1'), 'primary')
+
+        router = EngineRouter(self.primary, [engine('replica_1', connects=False),
+                                             engine('replica_2')])
+        self.assertEqual(router.read_sql('select 1'), 'replica_2')
+
+    def test_failover_on_dropped_connection(self):
+        def read_sql(sql_text, engine_, **options):
+            if engine_.url == 'replica_1':
+                raise operational_error(connection_invalidated=True)
+            return engine_.url
+        self.db_utils.read_sql.side_effect = read_sql
+        router = EngineRouter(self.primary, [engine('replica_1'), engine('replica_2')])
+        self.assertEqual(router.read_sql('select 1'), 'replica_2')
+
+    def test_no_failover_on_query_error(self):
+        self.db_utils.read_sql.side_effect = operational_error(connection_invalidated=False)
+        router = EngineRouter(self.primary, [engine('replica_1'), engine('replica_2')])
+        with self.assertRaises(OperationalError):
+            router.read_sql('select pg_sleep(600)')
+        self.assertEqual(self.db_utils.read_sql.call_count, 1)
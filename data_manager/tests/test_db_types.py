@@ -0,0 +1,101 @@
+"""
+Test Cases for the NUMERIC decoding policies
+"""
+
+# pylint: skip-file
+
+import io
+import unittest
+from collections import namedtuple
+
+import pandas as pd
+from parameterized import parameterized
+
+from data_manager.db_copy import decode_csv_copy
+from data_manager.db_types import numeric_series_to_fixed, numeric_to_fixed
+
+Column = namedtuple('Column', 'name type_code')
+
+
+class TestNumericToFixed(unittest.TestCase):
+    """
+    class to test the scaled int64 NUMERIC conversion
+    """
+    @parameterized.expand([
+        ('12.5', 4, 125000),
+        ('-12.5', 4, -125000),
+        ('0', 4, 0),
+        ('7', 0, 7),
+        ('1.23456', 4, 12346),
+        ('-1.23455', 4, -12346),
+        ('0.00005', 4, 1),
+    ])
+    def test_numeric_to_fixed(self, value, scale, expected):
+        self.assertEqual(numeric_to_fixed(value, scale), expected)
+
+    def test_numeric_to_fixed_nan(self):
+        with self.assertRaises(Exception):
+            numeric_to_fixed('NaN', 4)
+
+    def test_series_matches_scalar(self):
+        values = pd.Series(['12.5', None, '-0.0001', '3', '1.23456', '-7.5'])
+        out_ = numeric_series_to_fixed(values, 4)
+        self.assertEqual(str(out_.dtype), 'Int64')
+        self.assertTrue(pd.isna(out_[1]))
+        for idx, value in values.items():
+            if pd.notna(value):
+                self.assertEqual(out_[idx], numeric_to_fixed(value, 4))
+
+    def test_series_fast_path(self):
+        out_ = numeric_series_to_fixed(pd.Series(['1.5', '-2.25', '10']), 2)
+        self.assertEqual(out_.tolist(), [150, -225, 1000])
+
+    def test_int64_limits(self):
+        values = pd.Series(['922337203685477.5807', '-922337203685477.5808', '12.5'])
+        self.assertEqual(numeric_series_to_fixed(values, 4).tolist(),
+                         [2 ** 63 - 1, -2 ** 63, 125000])
+
+    @parameterized.expand([
+        ('fast_path', '999999999999999.9999', 4),
+        ('past_max', '922337203685477.5808', 4),
+        ('past_min', '-922337203685477.5809', 4),
+        ('rounded', '9223372036854775807.5', 0),
+        ('large_scale', '1000000000', 10),
+    ])
+    def test_int64_overflow(self, _, value, scale):
+        with self.assertRaises(ValueError):
+            numeric_to_fixed(value, scale)
+        with self.assertRaises(ValueError):
+            numeric_series_to_fixed(pd.Series(['1', value, None]), scale)
+
+    @parameterized.expand([
+        ('empty', pd.Series([], dtype=object)),
+        ('all_null', pd.Series([None, None], dtype=object)),
+    ])
+    def test_series_without_values(self, _, values):
+        out_ = numeric_series_to_fixed(values, 4)
+        self.assertEqual(str(out_.dtype), 'Int64')
+        self.assertEqual(len(out_), len(values))
+        self.assertTrue(out_.isna().all())
+
+
+class TestDecodeNumeric(unittest.TestCase):
+    """
+    class to test the NUMERIC policies of the COPY TO parser
+    """
+    description = [Column('id', 20), Column('px', 1700)]
+
+    def test_empty_result(self):
+        out_ = decode_csv_copy(io.BytesIO(b''), self.description, numeric_dtype='int64')
+        self.assertEqual(out_.columns.tolist(), ['id', 'px'])
+        self.assertEqual(len(out_), 0)
+
+    def test_all_null_numeric(self):
+        out_ = decode_csv_copy(io.BytesIO(b'1,\\N\n'), self.description, numeric_dtype='int64')
+        self.assertEqual(out_['id'].tolist(), [1])
+        self.assertTrue(pd.isna(out_['px'][0]))
+
+    def test_int64_policy(self):
+        out_ = decode_csv_copy(io.BytesIO(b'1,12.5\n2,-0.25\n'), self.description,
+                               numeric_dtype='int64', numeric_scale=2)
+        self.assertEqual(out_['px'].tolist(), [1250, -25])
@@ -0,0 +1,48 @@
+"""
+Test Cases for the fan-out reads, the per source read is mocked
+"""
+
+# pylint: skip-file
+
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from data_manager import db_utils
+
+
+def read_source(sql_text, engine, timeout=None, **parameters):
+    """
+    per source read stand-in, the sql text is the seconds the source takes
+    """
+    time.sleep(float(sql_text))
+    return pd.DataFrame({'id': [1]})
+
+
+class TestReadSqlFanout(unittest.TestCase):
+    """
+    class to test the deadline of the fan-out sources
+    """
+    def setUp(self):
+        for name, value in (('__read_sql_timeout', read_source), ('FANOUT_GRACE', 0.05)):
+            patcher = mock.patch.object(db_utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.queries = {'fast': (None, '0'), 'stuck': (None, '1')}
+
+    def test_stuck_source_raises(self):
+        start = time.monotonic()
+        with self.assertRaisesRegex(Exception, 'failed on stuck'):
+            db_utils.read_sql_fanout(self.queries, timeout=0.05)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_stuck_source_ignored(self):
+        out_ = db_utils.read_sql_fanout(self.queries, timeout=0.05, errors='ignore')
+        self.assertEqual(out_['source'].tolist(), ['fast'])
+
+    def test_source_timeout_overrides(self):
+        out_ = db_utils.read_sql_fanout(self.queries, timeout=0.05, timeouts={'stuck': 5},
+                                        errors='ignore')
+        self.assertEqual(out_['source'].tolist(), ['fast', 'stuck'])
@@ -0,0 +1,96 @@
+"""
+Test Cases for the long-lived writers, to_sql is mocked
+"""
+
+# pylint: skip-file
+
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from data_manager.db_load import LoadMetrics
+from data_manager.db_writer import BufferedWriter
+
+
+def written(data, engine, table_name, **options):
+    """
+    to_sql stand-in returning the metrics of the data
+    """
+    return LoadMetrics(table_name=table_name, rows_written=len(data), chunk_count=1)
+
+
+class TestBufferedWriter(unittest.TestCase):
+    """
+    class to test the flush triggers of the micro-batching writer
+    """
+    def setUp(self):
+        patcher = mock.patch('data_manager.db_writer.to_sql', side_effect=written)
+        self.to_sql = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def frames(self):
+        return [call[0][0] for call in self.to_sql.call_args_list]
+
+    def test_row_trigger(self):
+        writer = BufferedWriter(None, 'prices', flush_rows=3, flush_bytes=None,
+                                flush_interval=None)
+        writer.write(pd.DataFrame({'id': [1, 2]}))
+        self.assertEqual(self.to_sql.call_count, 0)
+        writer.write(pd.DataFrame({'id': [3]}))
+        self.assertEqual(self.to_sql.call_count, 1)
+        self.assertEqual(self.frames()[0]['id'].tolist(), [1, 2, 3])
+        writer.write(pd.DataFrame({'id': [4]}))
+        self.assertEqual(writer.close().rows_written, 4)
+        self.assertEqual(self.to_sql.call_count, 2)
+
+    def test_byte_trigger(self):
+        frame = pd.DataFrame({'id': range(10)})
+        size = int(frame.memory_usage(index=False, deep=True).sum())
+        writer = BufferedWriter(None, 'prices', flush_rows=None, flush_bytes=2 * size,
+                                flush_interval=None)
+        writer.write(frame)
+        self.assertEqual(self.to_sql.call_count, 0)
+        writer.write(frame)
+        self.assertEqual(self.to_sql.call_count, 1)
+        self.assertEqual(len(self.frames()[0]), 20)
+
+    def test_interval_trigger(self):
+        writer = BufferedWriter(None, 'prices', flush_rows=None, flush_bytes=None,
+                                flush_interval=0.05)
+        writer.write(pd.DataFrame({'id': [1]}))
+        deadline = time.monotonic() + 2.0
+        while self.to_sql.call_count == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.to_sql.call_count, 1)
+        writer.close()
+        self.assertEqual(self.to_sql.call_count, 1)
+
+    def test_failed_flush_keeps_frames(self):
+        self.to_sql.side_effect = Exception('database down')
+        writer = BufferedWriter(None, 'prices', flush_rows=None, flush_bytes=None,
+                                flush_interval=None)
+        writer.write(pd.DataFrame({'id': [1]}))
+        with self.assertRaises(Exception):
+            writer.flush()
+        writer.write(pd.DataFrame({'id': [2]}))
+        self.to_sql.side_effect = written
+        self.assertEqual(writer.flush().rows_written, 2)
+        self.assertEqual(self.frames()[-1]['id'].tolist(), [1, 2])
+        self.assertIsNone(writer.flush())
+
+    def test_upsert_keys_keep_last_row(self):
+        writer = BufferedWriter(None, 'prices', flush_interval=None, upsert_keys=['id'])
+        writer.write(pd.DataFrame({'id': [1, 2], 'px': [1.0, 2.0]}))
+        writer.write(pd.DataFrame({'id': [1], 'px': [1.5]}))
+        writer.close()
+        data = self.frames()[0]
+        self.assertEqual(data.sort_values('id')['px'].tolist(), [1.5, 2.0])
+        self.assertEqual(self.to_sql.call_args[1]['upsert_keys'], ['id'])
+
+    def test_closed(self):
+        writer = BufferedWriter(None, 'prices', flush_interval=None)
+        writer.close()
+        with self.assertRaises(Exception):
+            writer.write(pd.DataFrame({'id': [1]}))
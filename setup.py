@@ -23,6 +23,13 @@ extra_reqs = {
         "tox>=2.3.1",
         "flake8>=3.7.9",
     ],
+    'cache': [
+        "pyarrow>=3.0.0",
+    ],
+    'async': [
+        "sqlalchemy>=1.4.24",
+        "asyncpg>=0.22.0",
+    ],
 }
 
 if __name__ == "__main__":